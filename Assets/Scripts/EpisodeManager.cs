@@ -4,6 +4,7 @@ using UnityEngine;
 using System;
 using System.IO;
 using System.Linq;
+using System.Globalization;
 
 public class EpisodeManager : MonoBehaviour
 {
@@ -210,24 +211,25 @@ public class EpisodeManager : MonoBehaviour
 
     public Dictionary<string, string> GetInfo()
     {
+        // floats are formatted independent of the system locale (always with a decimal point), python parses them directly
         Dictionary<string, string> info = new Dictionary<string, string>();
         info.Add("endEvent", this.episodeStatus.ToString());
-        info.Add("duration", this.duration.ToString());
-        info.Add("cumreward", this.cumReward.ToString());
+        info.Add("duration", this.duration.ToString(CultureInfo.InvariantCulture));
+        info.Add("cumreward", this.cumReward.ToString(CultureInfo.InvariantCulture));
         info.Add("passedGoals", this.passedGoals.Count.ToString());
         info.Add("passedFirstGoal", this.passedGoals.Contains(0) ? "1" : "0");
         info.Add("passedSecondGoal", this.passedGoals.Contains(1) ? "1" : "0");
         info.Add("passedThirdGoal", this.passedGoals.Contains(2) ? "1" : "0");
 
         info.Add("numberOfGoals", this.numberOfGoals.ToString());
-        info.Add("distanceReward", this.distanceReward.ToString());
-        info.Add("orientationReward", this.orientationReward.ToString());
-        info.Add("eventReward", this.eventReward.ToString());
-        info.Add("velocityReward", this.velocityReward.ToString());
-        info.Add("prescaleDistanceReward", this.prescaleDistanceReward.ToString());
-        info.Add("prescaleOrientationReward", this.prescaleOrientationReward.ToString());
-        info.Add("prescaleEventReward", this.prescaleEventReward.ToString());
-        info.Add("prescaleVelocityReward", this.prescaleVelocityReward.ToString());
+        info.Add("distanceReward", this.distanceReward.ToString(CultureInfo.InvariantCulture));
+        info.Add("orientationReward", this.orientationReward.ToString(CultureInfo.InvariantCulture));
+        info.Add("eventReward", this.eventReward.ToString(CultureInfo.InvariantCulture));
+        info.Add("velocityReward", this.velocityReward.ToString(CultureInfo.InvariantCulture));
+        info.Add("prescaleDistanceReward", this.prescaleDistanceReward.ToString(CultureInfo.InvariantCulture));
+        info.Add("prescaleOrientationReward", this.prescaleOrientationReward.ToString(CultureInfo.InvariantCulture));
+        info.Add("prescaleEventReward", this.prescaleEventReward.ToString(CultureInfo.InvariantCulture));
+        info.Add("prescaleVelocityReward", this.prescaleVelocityReward.ToString(CultureInfo.InvariantCulture));
         info.Add("step", this.step.ToString());
         info.Add("amount_of_steps", (this.step + 1).ToString());
         info.Add("amount_of_steps_based_on_rewardlist", this.step_rewards.Count.ToString());
@@ -107,6 +107,20 @@ public class PeacefulPieCarCommandReceiver : MonoBehaviour
             return arenas[id].reset(mt, spawnRot, lightSettingEnum, evalMode, videoFilename, jetbotName);
         }
 
+        [JsonRpcMethod]
+        string[] bundledReset(List<int> ids, List<string> mapTypes, List<float> spawnRots, List<string> lightSettings, List<bool> evalModes, List<string> videoFilenames, List<string> jetbotNames)
+        {
+            // resets multiple arenas with a single request, the arguments are given per arena
+            List<string> observations = new List<string>();
+
+            for (int i = 0; i < ids.Count; i++)
+            {
+                observations.Add(reset(ids[i], mapTypes[i], spawnRots[i], lightSettings[i], evalModes[i], videoFilenames[i], jetbotNames[i]));
+            }
+
+            return observations.ToArray();
+        }
+
         [JsonRpcMethod]
         void say(string message)
         {
@@ -149,6 +163,26 @@ public class PeacefulPieCarCommandReceiver : MonoBehaviour
             return objects;
         }
 
+        [JsonRpcMethod]
+        StepReturnObjectList bundledStepIds(List<int> ids, List<int> step_nrs, List<float> left_actions, List<float> right_actions)
+        {
+            // like bundledStep, but only steps the arenas with the given ids (e.g. arenas that finished all their evaluation episodes are skipped)
+            float beforeTime = Time.realtimeSinceStartup;
+            StepReturnObjectList objects = new StepReturnObjectList();
+
+            for (int i = 0; i < ids.Count; i++)
+            {
+                StepReturnObject stepReturnObject = arenas[ids[i]].step(step_nrs[i], left_actions[i], right_actions[i]);
+                objects.objects.Add(stepReturnObject);
+            }
+            float step_script_realtime = Time.realtimeSinceStartup - beforeTime;
+            step_script_realtime_duration += step_script_realtime;
+
+            objects.step_script_realtime_duration = step_script_realtime_duration;
+
+            return objects;
+        }
+
         [JsonRpcMethod]
         void startArena(int id, float distanceCoefficient, float orientationCoefficient, float velocityCoefficient, float eventCoefficient, int resWidth, int resHeight, bool fixedTimesteps, float fixedTimestepsLength, string collisionMode)
         {
@@ -205,6 +239,18 @@ public class PeacefulPieCarCommandReceiver : MonoBehaviour
             return observations.ToArray();
         }
 
+        [JsonRpcMethod]
+        string[] getObservations(List<int> ids)
+        {
+            List<string> observations = new List<string>();
+            foreach (int id in ids)
+            {
+                observations.Add(arenas[id].getObservation());
+            }
+
+            return observations.ToArray();
+        }
+
         [JsonRpcMethod]
         string getArenaScreenshot(int id)
         {
@@ -1,9 +1,6 @@
 from typing import Any, SupportsFloat
 import gymnasium.spaces as spaces
 import gymnasium as gym
-from gymnasium.utils.env_checker import check_env
-
-from stable_baselines3.common.env_checker import check_env as check_env_sb3
 
 import numpy as np
 
@@ -18,11 +15,10 @@ import base64
 import os
 
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 import time
 
-from stable_baselines3.common import torch_layers
-
 from gymEnv.histogram_equilization import hist_eq
 
 from gymEnv.myEnums import MapType, EndEvent, SpawnOrientation, LightSetting
@@ -47,6 +43,8 @@ class BaseCarsimEnv(gym.Env):
 
     unity_comms = None
     instancenumber = 0
+    # shared by all envs, decodes the observations of the bundled requests in parallel (see stringsToObservations)
+    decode_pool = None
 
     def __init__(self, agentImageWidth=336, agentImageHeight=168, port=9000, log=False, jetBotName=None, spawnOrientation=None, fixedTimestepsLength=None, trainingMapType=MapType.randomEval, trainingLightSetting=LightSetting.random, image_preprocessing={}, frame_stacking=5, coefficients=None, collisionMode=None, use_unity=True):
         # height and width was previous 168, that way we could downsample and reach the same dimensions as the nature paper of 84 x 84
@@ -164,32 +162,32 @@ class BaseCarsimEnv(gym.Env):
 
         
         stepObj: StepReturnObject = self.unityImmediateStep(left_acceleration, right_acceleration)
-        waitTimeStart=time.time()
-        waitTime=False
-        while stepObj.previousStepNotFinished:
-            waitTime = time.time() - waitTimeStart
-            stepObj: StepReturnObject = self.unityImmediateStep(left_acceleration, right_acceleration)
+        if stepObj.previousStepNotFinished:
+            # the clock is only read when unity is not done with the previous step
+            waitTimeStart = time.perf_counter_ns()
+            while stepObj.previousStepNotFinished:
+                waitTime = time.perf_counter_ns() - waitTimeStart
+                stepObj: StepReturnObject = self.unityImmediateStep(left_acceleration, right_acceleration)
 
-        if waitTime:
-            self.episodeWaitTime += waitTime
+            self.episodeWaitTime += waitTime / 1e9
 
         return self.processStepReturnObject(stepObj)
 
     
-    def bundledStep(self, step_nrs, left_actions: list[float], right_actions: list[float]) -> list[StepReturnObject]:
+    def bundledStep(self, step_nrs, left_actions: list[float], right_actions: list[float], ids=None) -> list[StepReturnObject]:
+        # ids selects the arenas to step, the other lists contain the values for these arenas
+        # all arenas are stepped if ids is None
         
-        stepObjList, step_script_realtime_duration = self.unityBundledStep(step_nrs, left_actions, right_actions)
+        stepObjList, step_script_realtime_duration = self.unityBundledStep(step_nrs, left_actions, right_actions, ids)
 
-        waitTimeStart=time.time()
-        waitTime=False
-        waiting = 0
-        while not self.allPreviousStepsFinished(stepObjList):
-            waitTime = time.time() - waitTimeStart
-            waiting += 1
-            stepObjList, step_script_realtime_duration = self.unityBundledStep(step_nrs, left_actions, right_actions)
+        if not self.allPreviousStepsFinished(stepObjList):
+            # the clock is only read when unity is not done with the previous steps
+            waitTimeStart = time.perf_counter_ns()
+            while not self.allPreviousStepsFinished(stepObjList):
+                waitTime = time.perf_counter_ns() - waitTimeStart
+                stepObjList, step_script_realtime_duration = self.unityBundledStep(step_nrs, left_actions, right_actions, ids)
 
-        if waitTime:
-            self.episodeWaitTime += waitTime
+            self.episodeWaitTime += waitTime / 1e9
 
         return stepObjList
 
@@ -209,6 +207,8 @@ class BaseCarsimEnv(gym.Env):
         truncated = stepObj.done
 
         info_dict = stepObj.info
+        # kept as the plain list from unity, the info dicts are written to the endInfo.yml files
+        # the policy converts it to a float32 array for the reward correction
         info_dict["rewards"] = stepObj.rewards
         info_dict["episodeWaitTime"] = self.episodeWaitTime
         info_dict["spawnRot"] = self.current_spawn_rot
@@ -230,8 +230,11 @@ class BaseCarsimEnv(gym.Env):
 
         return new_obs, reward, terminated, truncated, info_dict
 
-    def unityBundledStep(self, step_nrs, left_actions, right_actions):
-        objectList = BaseCarsimEnv.unity_comms.bundledStep(ResultClass=StepReturnObjectList, step_nrs=step_nrs, left_actions=left_actions, right_actions=right_actions)
+    def unityBundledStep(self, step_nrs, left_actions, right_actions, ids=None):
+        if ids is None:
+            objectList = BaseCarsimEnv.unity_comms.bundledStep(ResultClass=StepReturnObjectList, step_nrs=step_nrs, left_actions=left_actions, right_actions=right_actions)
+        else:
+            objectList = BaseCarsimEnv.unity_comms.bundledStepIds(ResultClass=StepReturnObjectList, ids=ids, step_nrs=step_nrs, left_actions=left_actions, right_actions=right_actions)
         return objectList.objects, objectList.step_script_realtime_duration
 
     # move all calls to seperate functions for profiling
@@ -244,6 +247,18 @@ class BaseCarsimEnv(gym.Env):
         return BaseCarsimEnv.unity_comms.reset(mapType=mp_name,
             id=self.instancenumber, spawnRot=spawn_rot, lightSetting=lightSettingName, evalMode=evalMode, videoFilename=video_filename, jetbotName=jetbot_name) 
 
+    def unityBundledReset(self, ids, reset_args):
+        return BaseCarsimEnv.unity_comms.bundledReset(ids=ids,
+            mapTypes=[args["mp_name"] for args in reset_args],
+            spawnRots=[args["spawn_rot"] for args in reset_args],
+            lightSettings=[args["lightSettingName"] for args in reset_args],
+            evalModes=[args["evalMode"] for args in reset_args],
+            videoFilenames=[args["video_filename"] for args in reset_args],
+            jetbotNames=[args["jetbot_name"] for args in reset_args])
+
+    def unityGetObservations(self, ids):
+        return BaseCarsimEnv.unity_comms.getObservations(ids=ids)
+
     def unityGetObservation(self):
         return BaseCarsimEnv.unity_comms.getObservation(id=self.instancenumber)
     
@@ -274,6 +289,16 @@ class BaseCarsimEnv(gym.Env):
         self.video_filename = video_filename
 
     def reset(self, seed = None, mapType = None, lightSetting = None, evalMode = False, spawnRot=None, jetBotName=None):
+        reset_args = self.prepareReset(seed=seed, mapType=mapType, lightSetting=lightSetting, evalMode=evalMode, spawnRot=spawnRot, jetBotName=jetBotName)
+
+        obsstring = self.unityReset(**reset_args)
+
+        # do not take the observation from the reset, since the camera needs a frame to get "ready"
+        return self.finishReset(self.unityGetObservation())
+
+    def prepareReset(self, seed = None, mapType = None, lightSetting = None, evalMode = False, spawnRot=None, jetBotName=None):
+        # resets the python side of the env and returns the arguments for the reset in unity
+        # split from reset so bundledReset can reset multiple envs with a single request
         super().reset(seed=seed)
 
         self.step_nr = -1
@@ -285,6 +310,7 @@ class BaseCarsimEnv(gym.Env):
             self.memory = np.zeros((self.height, self.width, self.channels_total), dtype=self.obs_dtype)
 
         mp_name = self.getMapTypeName(mapType=mapType)
+        self.current_map_name = mp_name
         lightSettingName = self.getLightSettingName(lightSetting)
 
         spawn_rot = self.getSpawnRot(spawnRot)
@@ -293,19 +319,25 @@ class BaseCarsimEnv(gym.Env):
         if jetBotName is None:
             jetBotName = self.jetBotName
 
-        obsstring = self.unityReset(mp_name, spawn_rot, video_filename=self.video_filename, lightSettingName=lightSettingName, evalMode=evalMode, jetbot_name=jetBotName)
-
-        
-        info = {"mapType": mp_name, "spawnRot": self.current_spawn_rot}
+        return {"mp_name": mp_name, "spawn_rot": spawn_rot, "video_filename": self.video_filename, "lightSettingName": lightSettingName, "evalMode": evalMode, "jetbot_name": jetBotName}
 
-        # do not take the observation from the reset, since the camera needs a frame to get "ready"
-        new_obs = self.stringToObservation(self.unityGetObservation())
+    def finishReset(self, obsstring):
+        # processes the first observation after the reset in unity
+        info = {"mapType": self.current_map_name, "spawnRot": self.current_spawn_rot}
 
+        new_obs = self.stringToObservation(obsstring)
 
         if self.frame_stacking > 1:
             new_obs = self.memory_rollover(new_obs)
 
         return new_obs, info
+
+    def bundledReset(self, ids, reset_args):
+        # resets the arenas with the given ids in a single request, reset_args are the results of prepareReset of the corresponding envs
+        self.unityBundledReset(ids, reset_args)
+
+        # do not take the observation from the reset, since the camera needs a frame to get "ready"
+        return self.unityGetObservations(ids)
     
     def resetMemory(self):
         self.memory = np.zeros((self.height, self.width, self.channels_total), dtype=self.obs_dtype)
@@ -412,7 +444,9 @@ class BaseCarsimEnv(gym.Env):
             self.rollover_log_before(new_obs, channels)
 
         # shift the channels to get rid of old stuff
-        self.memory = np.roll(self.memory, shift=self.channels, axis=2)
+        # in place instead of np.roll, which allocates a new memory every step (the wrapped around channels are overwritten below anyway)
+        # the callers copy the returned memory (e.g. DummyVecEnv._save_obs, step_wrapper) before the next rollover
+        self.memory[:, :, channels:] = self.memory[:, :, :-channels]
 
         if log:
             self.rollover_log_post_rollover(channels)
@@ -472,14 +506,17 @@ class BaseCarsimEnv(gym.Env):
         im = Image.fromarray(obs, 'L') # https://pillow.readthedocs.io/en/stable/handbook/concepts.html#concept-modes
         im.save(f"{filename_prefix}.png")
 
+    # png is lossless, the compression level only trades file size for encoding time
+    png_compress_level = 1
+
     def saveImage(self, array, filename):
         img = Image.fromarray(array, 'RGB')
-        img.save(filename)
+        img.save(filename, compress_level=self.png_compress_level)
 
 
     def saveImageGrayscale(self, array, filename):
         img = Image.fromarray(array, 'L')
-        img.save(filename)
+        img.save(filename, compress_level=self.png_compress_level)
 
     def read_preprocessing(self, image_preprocessing):
         if image_preprocessing["downsampling_factor"]:
@@ -499,7 +536,13 @@ class BaseCarsimEnv(gym.Env):
     def preprocessDownsample(self, pixels, log=False):
 
         x, y = self.downsampling_factor, self.downsampling_factor
-        pixels_downsampled = block_reduce(pixels, block_size=(x, y, 1), func=np.mean)
+        height, width, channels = pixels.shape
+        if height % x == 0 and width % y == 0:
+            # the same blocks as block_reduce, as a reshaped view, block_reduce checks and pads the input every call
+            blocks = pixels.reshape(height // x, x, width // y, y, channels).transpose(0, 2, 4, 1, 3)
+            pixels_downsampled = blocks.mean(axis=(3, 4))
+        else:
+            pixels_downsampled = block_reduce(pixels, block_size=(x, y, 1), func=np.mean)
         # if x==y==2 it halves the size along each dim
         
 
@@ -529,7 +572,8 @@ class BaseCarsimEnv(gym.Env):
     
     def preprocessEqualize(self, pixels, log):
         assert self.grayscale, f'equalize only works with grayscale images'
-        pixels_equalized, histOrig, histEq = hist_eq(pixels)
+        # the histogram of the equalized image is not used for the observations
+        pixels_equalized, histOrig, histEq = hist_eq(pixels, compute_new_histogram=False)
 
         if log:
             pixels_equalized_uint8 = pixels_equalized.astype(np.uint8)
@@ -541,6 +585,34 @@ class BaseCarsimEnv(gym.Env):
 
         return pixels_equalized
 
+    def stringsToObservations(self, obsstrings, log=None):
+        # decodes the observations of several arenas (e.g. all arenas of a bundled request) into one array (n, *observation shape)
+        # uses the preprocessing settings of this env, all envs of a run are created with the same settings
+        # the array is reused by the next call, the observations have to be copied (e.g. by memory_rollover) before that
+        first_obs = self.stringToObservation(obsstrings[0], log)
+
+        shape = (len(obsstrings), *first_obs.shape)
+        if getattr(self, "_decoded_obs_buf", None) is None or self._decoded_obs_buf.shape != shape:
+            self._decoded_obs_buf = np.empty(shape, dtype=self.obs_dtype)
+
+        self._decoded_obs_buf[0] = first_obs
+
+        def decode(i):
+            self._decoded_obs_buf[i] = self.stringToObservation(obsstrings[i], log)
+
+        if (log if log is not None else self.log) or len(obsstrings) <= 2:
+            # the logging writes to the same files for every observation, it stays sequential
+            for i in range(1, len(obsstrings)):
+                decode(i)
+        else:
+            # the png decoding (PIL) and the numpy preprocessing release the GIL, the rows are written independently
+            if BaseCarsimEnv.decode_pool is None:
+                BaseCarsimEnv.decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+            # list() waits for all rows and raises the exceptions of the workers
+            list(BaseCarsimEnv.decode_pool.map(decode, range(1, len(obsstrings))))
+
+        return self._decoded_obs_buf
+
     def stringToObservationStep(self, obsstring, log=None):
         return self.stringToObservation(obsstring, log)
 
@@ -557,11 +629,10 @@ class BaseCarsimEnv(gym.Env):
     
     def preprocessing(self, im, log=None):
         preprocessing_priority = ["downsample", "grayscale", "equalize"]
-
-        pixels_rgb = np.array(im, dtype=np.uint8)
-        # it looks like this switches the height and width
         
         if log:
+            # the uint8 copy is only needed for the logged images
+            pixels_rgb = np.array(im, dtype=np.uint8)
             print("logging the image")
             if not os.path.exists('imagelog'):
                 os.makedirs('imagelog')
@@ -574,6 +645,7 @@ class BaseCarsimEnv(gym.Env):
             if type(log) == str:
                 self.saveImage(pixels_rgb, f"{log}_image_from_unity.png")
 
+        # it looks like this switches the height and width
         pixels_float = np.array(im, dtype=np.float32)
         
         
@@ -609,7 +681,8 @@ class BaseCarsimEnv(gym.Env):
         base64_bytes = string.encode('ascii')
         message_bytes = base64.b64decode(base64_bytes)
 
-        im = Image.open(io.BytesIO(message_bytes))
+        # unity always sends png (EncodeToPNG in Arena.cs), PIL does not have to try the other formats or load all of its plugins
+        im = Image.open(io.BytesIO(message_bytes), formats=["PNG"])
 
         return im
 
@@ -630,6 +703,9 @@ class BaseCarsimEnv(gym.Env):
         return im
 
 if __name__ == '__main__':
+    # the env checkers import torch through stable baselines 3, the env itself only needs numpy and the unity connection
+    from gymnasium.utils.env_checker import check_env
+    from stable_baselines3.common.env_checker import check_env as check_env_sb3
 
     env = BaseCarsimEnv()
     env.reset()
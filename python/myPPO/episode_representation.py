@@ -1,17 +1,20 @@
-from dataclasses import dataclass
+from typing import NamedTuple
 
-@dataclass(repr=True, eq=True, frozen=False, unsafe_hash=True)
-class EpisodeRepresentation:
+# tuple based, hashing and comparison (e.g. in collections.Counter) are done by tuple.__hash__ and tuple.__eq__
+class EpisodeRepresentation(NamedTuple):
     endEvent: str
     collision: bool
     passedFirstGoal: bool
     passedSecondGoal: bool
     passedThirdGoal: bool
 
-    def __init__(self, info):
+    @classmethod
+    def from_info(cls, info):
 
-        self.endEvent = info["endEvent"]
-        self.collision = int(info["collision"]) == 1
-        self.passedFirstGoal = int(info["passedFirstGoal"]) == 1
-        self.passedSecondGoal = int(info["passedSecondGoal"]) == 1
-        self.passedThirdGoal = int(info["passedThirdGoal"]) == 1
\ No newline at end of file
+        return cls(
+            endEvent=info["endEvent"],
+            collision=int(info["collision"]) == 1,
+            passedFirstGoal=int(info["passedFirstGoal"]) == 1,
+            passedSecondGoal=int(info["passedSecondGoal"]) == 1,
+            passedThirdGoal=int(info["passedThirdGoal"]) == 1,
+        )
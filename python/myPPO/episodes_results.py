@@ -1,3 +1,4 @@
+import numpy as np
 
 class EpisodesResults:
 
@@ -25,6 +26,31 @@ class EpisodesResults:
 
     episodes_finishLineHit = 0
 
+    # (attribute, info key) of the values that are summed over all episodes
+    int_sums = (
+        ("timesteps_of_completed_episodes", "amount_of_steps"),
+        ("collision_episodes", "collision"),
+        ("obstacle_collision_episodes", "obstacleCollision"),
+        ("wall_collision_episodes", "wallCollision"),
+        ("episodes_finishLineHit", "finishLineHit"),
+        ("successfully_passed_first_goals", "passedFirstGoal"),
+        ("successfully_passed_second_goals", "passedSecondGoal"),
+        ("successfully_passed_third_goals", "passedThirdGoal"),
+    )
+    # unity formats these independent of the locale, they can be parsed directly
+    float_sums = (
+        ("total_reward", "cumreward"),
+        ("distance_reward", "distanceReward"),
+        ("velocity_reward", "velocityReward"),
+        ("event_reward", "eventReward"),
+        ("orientation_reward", "orientationReward"),
+        ("prescale_distance_reward", "prescaleDistanceReward"),
+        ("prescale_velocity_reward", "prescaleVelocityReward"),
+        ("prescale_event_reward", "prescaleEventReward"),
+        ("prescale_orientation_reward", "prescaleOrientationReward"),
+        ("unity_duration", "duration"),
+    )
+
     def __init__(self):
         pass
 
@@ -32,71 +58,79 @@ class EpisodesResults:
         return infos["endEvent"] == "Success" or int(infos["numberOfGoals"]) == int(infos["passedGoals"])
 
     def processInfoDictEpisodeFinished(self, infos):
+        for attribute, key in self.int_sums:
+            setattr(self, attribute, getattr(self, attribute) + int(infos[key]))
+        for attribute, key in self.float_sums:
+            setattr(self, attribute, getattr(self, attribute) + float(infos[key]))
+        self.waitTime += float(infos["episodeWaitTime"])
+
+        self.processEpisodeOutcome(infos)
+
+    def processInfoDictsEpisodesFinished(self, infos_list):
+        # same result as processInfoDictEpisodeFinished for every info dict
+        # the summed values are parsed and summed with numpy for all episodes at once (e.g. at the end of an evaluation)
+        if len(infos_list) == 0:
+            return
+
+        for attribute, key in self.int_sums:
+            values = np.array([infos[key] for infos in infos_list]).astype(np.int64)
+            setattr(self, attribute, getattr(self, attribute) + int(values.sum()))
+        for attribute, key in self.float_sums:
+            values = np.array([infos[key] for infos in infos_list], dtype=str).astype(np.float64)
+            setattr(self, attribute, getattr(self, attribute) + float(values.sum()))
+        self.waitTime += float(sum(float(infos["episodeWaitTime"]) for infos in infos_list))
+
+        for infos in infos_list:
+            self.processEpisodeOutcome(infos)
+
+    def processEpisodeOutcome(self, infos):
+        # the counters that depend on the outcome of the episode
+        # the values that are needed multiple times are parsed only once
 
         self.completed_episodes += 1
 
-        if self.is_success(infos):
+        success = self.is_success(infos)
+        number_of_goals = int(infos["numberOfGoals"])
+        passed_goals = int(infos["passedGoals"])
+        collision = int(infos["collision"])
+
+        if success:
             self.successfully_completed_episodes += 1
 
         if infos["endEvent"] == "Timeout":
             self.timeouts += 1
+
+            if number_of_goals == passed_goals:
+                self.episodes_timeout_all_goals_successful += 1
         else:
             #print(f'end event is {infos["endEvent"]}')
             # FinishMissed
             pass
 
-        if infos["endEvent"] == "Timeout" and int(infos["numberOfGoals"]) == int(infos["passedGoals"]):
-            self.episodes_timeout_all_goals_successful += 1
+        self.successfully_passed_goals += passed_goals
+        self.number_of_goals += number_of_goals
 
-        self.successfully_passed_goals += int(infos["passedGoals"])
-        self.number_of_goals += int(infos["numberOfGoals"])
-        self.total_reward += float(infos["cumreward"].replace(",","."))
-        self.timesteps_of_completed_episodes += int(infos["amount_of_steps"])
-        self.collision_episodes += int(infos["collision"])
-        self.obstacle_collision_episodes += int(infos["obstacleCollision"])
-        self.wall_collision_episodes += int(infos["wallCollision"])
-        self.episodes_finishLineHit += int(infos["finishLineHit"])
-
-        self.distance_reward += float(infos["distanceReward"].replace(",","."))
-        self.velocity_reward += float(infos["velocityReward"].replace(",","."))
-        self.event_reward += float(infos["eventReward"].replace(",","."))
-        self.orientation_reward += float(infos["orientationReward"].replace(",","."))
-
-        self.prescale_distance_reward += float(infos["prescaleDistanceReward"].replace(",","."))
-        self.prescale_velocity_reward += float(infos["prescaleVelocityReward"].replace(",","."))
-        self.prescale_event_reward += float(infos["prescaleEventReward"].replace(",","."))
-        self.prescale_orientation_reward += float(infos["prescaleOrientationReward"].replace(",","."))
-
-        self.successfully_passed_first_goals += int(infos["passedFirstGoal"])
-
-        self.successfully_passed_second_goals += int(infos["passedSecondGoal"])
-        self.successfully_passed_third_goals += int(infos["passedThirdGoal"])
-
-        self.waitTime += float(infos["episodeWaitTime"])
-
-        self.unity_duration += float(infos["duration"].replace(",","."))
-
-        if int(infos["collision"]) == 1 and self.is_success(infos):
+        if collision == 1 and success:
             self.successful_episodes_with_collisions += 1
 
-        if infos["mapDifficulty"] == "easy":
+        difficulty = infos["mapDifficulty"]
+        if difficulty == "easy":
             self.num_easy_episodes += 1
-            self.easy_goals += int(infos["numberOfGoals"])
-            self.successful_easy_goals += int(infos["passedGoals"])
-            if self.is_success(infos):
+            self.easy_goals += number_of_goals
+            self.successful_easy_goals += passed_goals
+            if success:
                 self.successful_easy_episodes += 1
-
-        if infos["mapDifficulty"] == "medium":
+        elif difficulty == "medium":
             self.num_medium_episodes += 1
-            self.medium_goals += int(infos["numberOfGoals"])
-            self.successful_medium_goals += int(infos["passedGoals"])
-            if self.is_success(infos):
+            self.medium_goals += number_of_goals
+            self.successful_medium_goals += passed_goals
+            if success:
                 self.successful_medium_episodes += 1
-        if infos["mapDifficulty"] == "hard":
+        elif difficulty == "hard":
             self.num_hard_episodes += 1
-            self.hard_goals += int(infos["numberOfGoals"])
-            self.successful_hard_goals += int(infos["passedGoals"])
-            if self.is_success(infos):
+            self.hard_goals += number_of_goals
+            self.successful_hard_goals += passed_goals
+            if success:
                 self.successful_hard_episodes += 1
 
     def computeRates(self):
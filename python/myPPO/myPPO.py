@@ -106,6 +106,8 @@ class myPPO(MyOnPolicyAlgorithm):
         use_bundled_calls: bool = False,
         use_fresh_obs: bool = False,
         print_network_and_loss_structure: bool = False,
+        use_compile: bool = False,
+        use_amp: bool = False,
     ):
         super().__init__(
             policy,
@@ -135,6 +137,8 @@ class myPPO(MyOnPolicyAlgorithm):
             use_bundled_calls=use_bundled_calls,
             use_fresh_obs=use_fresh_obs,
             print_network_and_loss_structure=print_network_and_loss_structure,
+            use_compile=use_compile,
+            use_amp=use_amp,
         )
 
         # Sanity check, otherwise it will lead to noisy gradient and NaN
@@ -186,6 +190,39 @@ class myPPO(MyOnPolicyAlgorithm):
 
             self.clip_range_vf = get_schedule_fn(self.clip_range_vf)
 
+        # evaluate_actions of the training minibatches
+        self._policy_evaluate_actions = self.policy.evaluate_actions
+        if getattr(self, "use_compile", False):
+            self._policy_evaluate_actions = self.compile_policy_evaluate_actions()
+
+    def compile_policy_evaluate_actions(self):
+        # every minibatch has the shape (batch_size, C, H, W), only the truncated last one of a rollout differs
+        # default mode instead of reduce-overhead, the parameters change after every minibatch and the backward pass goes through the graph
+        # falls back to the eager evaluate_actions if torch.compile is not available or fails
+        if not hasattr(th, "compile"):
+            return self.policy.evaluate_actions
+
+        compiled_evaluate_actions = th.compile(self.policy.evaluate_actions, dynamic=False)
+
+        # warm up with one dummy minibatch, the compilation is done here instead of during the first train()
+        dummy_obs = th.from_numpy(np.zeros((self.batch_size, *self.observation_space.shape), dtype=self.observation_space.dtype)).to(self.device)
+        if self._channels_last:
+            dummy_obs = dummy_obs.contiguous(memory_format=th.channels_last)
+        dummy_actions = th.zeros((self.batch_size, self.rollout_buffer.action_dim), dtype=th.float32, device=self.device)
+        if isinstance(self.action_space, spaces.Discrete):
+            dummy_actions = dummy_actions.long().flatten()
+        self.policy.set_training_mode(True)
+        try:
+            with self.forward_autocast():
+                compiled_evaluate_actions(dummy_obs, dummy_actions)
+        except Exception as e:
+            print(f'WARNING: torch.compile of evaluate_actions failed, using the eager policy: {e}', flush=True)
+            return self.policy.evaluate_actions
+        finally:
+            self.policy.set_training_mode(False)
+
+        return compiled_evaluate_actions
+
 
 
     def print_loss_structure(self, loss, policy_loss, value_loss):
@@ -241,7 +278,17 @@ class myPPO(MyOnPolicyAlgorithm):
                 if self.use_sde:
                     self.policy.reset_noise(self.batch_size)
 
-                values, log_prob, entropy = self.policy.evaluate_actions(rollout_data.observations, actions)
+                observations = rollout_data.observations
+                if self._channels_last:
+                    # same layout as the conv weights of the policy, see _setup_model
+                    observations = observations.contiguous(memory_format=th.channels_last)
+
+                with self.forward_autocast():
+                    values, log_prob, entropy = self._policy_evaluate_actions(observations, actions)
+                if self._use_amp:
+                    # the losses are computed in float32, the optimizer state stays float32 as well
+                    values, log_prob = values.float(), log_prob.float()
+                    entropy = None if entropy is None else entropy.float()
                 values = values.flatten()
                 # Normalize advantage
                 advantages = rollout_data.advantages
@@ -310,12 +357,15 @@ class myPPO(MyOnPolicyAlgorithm):
 
                 # Optimization step
                 self.policy.optimizer.zero_grad()
-                loss.backward()
-
+                self._grad_scaler.scale(loss).backward()
 
+                # the gradients are unscaled before clipping, so max_grad_norm keeps its meaning with float16
+                self._grad_scaler.unscale_(self.policy.optimizer)
                 # Clip grad norm
                 th.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
-                self.policy.optimizer.step()
+                # skips the step if the scaled gradients overflowed
+                self._grad_scaler.step(self.policy.optimizer)
+                self._grad_scaler.update()
 
                 if self.print_network_and_loss_structure:
                     self.print_loss_structure(loss, policy_loss, value_loss)
@@ -64,6 +64,8 @@ class MyRolloutBuffer(BaseBuffer):
         self.gae_lambda = gae_lambda
         self.gamma = gamma
         self.generator_ready = False
+        # observation shape -> (pinned staging tensor, cuda event of its last upload), see observations_to_torch
+        self._observation_staging = {}
         self.reset()
 
     def reset(self) -> None:
@@ -104,20 +106,27 @@ class MyRolloutBuffer(BaseBuffer):
         # Convert to numpy
         last_values = last_values.clone().cpu().numpy().flatten()
 
-        last_gae_lam = 0
-        for step in reversed(range(self.buffer_size)):
-            if step == self.buffer_size - 1:
-                next_non_terminal = 1.0 - dones
-                next_values = last_values
-            else:
-                next_non_terminal = 1.0 - self.episode_starts[step + 1]
-                next_values = self.values[step + 1]
-            delta = self.rewards[step] + self.gamma * next_values * next_non_terminal - self.values[step]
-            last_gae_lam = delta + self.gamma * self.gae_lambda * next_non_terminal * last_gae_lam
-            self.advantages[step] = last_gae_lam
+        # everything except the recurrence itself is computed for all steps at once
+        next_non_terminal = np.empty_like(self.episode_starts)
+        next_non_terminal[:-1] = 1.0 - self.episode_starts[1:]
+        next_non_terminal[-1] = 1.0 - dones
+
+        next_values = np.empty_like(self.values)
+        next_values[:-1] = self.values[1:]
+        next_values[-1] = last_values
+
+        deltas = self.rewards + self.gamma * next_values * next_non_terminal - self.values
+        discounts = self.gamma * self.gae_lambda * next_non_terminal
+
+        # the recurrence writes directly into the rows of self.advantages, no temporary arrays per step
+        # the advantage after the last step is 0, so the last row is just its delta
+        self.advantages[-1] = deltas[-1]
+        for step in reversed(range(self.buffer_size - 1)):
+            np.multiply(discounts[step], self.advantages[step + 1], out=self.advantages[step])
+            self.advantages[step] += deltas[step]
         # TD(lambda) estimator, see Github PR #375 or "Telescoping in TD(lambda)"
         # in David Silver Lecture 4: https://www.youtube.com/watch?v=PnHCvfgC_ZA
-        self.returns = self.advantages + self.values
+        np.add(self.advantages, self.values, out=self.returns)
 
     def add(
         self,
@@ -150,10 +159,11 @@ class MyRolloutBuffer(BaseBuffer):
         # Reshape to handle multi-dim and discrete action spaces, see GH #970 #1392
         action = action.reshape((self.n_envs, self.action_dim))
 
-        self.observations[self.pos] = np.array(obs).copy()
-        self.actions[self.pos] = np.array(action).copy()
-        self.rewards[self.pos] = np.array(reward).copy()
-        self.episode_starts[self.pos] = np.array(episode_start).copy()
+        # assigning into the preallocated slot already copies, np.asarray avoids an additional temporary copy
+        self.observations[self.pos] = np.asarray(obs, dtype=self.observations.dtype)
+        self.actions[self.pos] = np.asarray(action, dtype=self.actions.dtype)
+        self.rewards[self.pos] = np.asarray(reward, dtype=self.rewards.dtype)
+        self.episode_starts[self.pos] = np.asarray(episode_start, dtype=self.episode_starts.dtype)
         self.values[self.pos] = value.clone().cpu().numpy().flatten()
         self.log_probs[self.pos] = log_prob.clone().cpu().numpy()
         self.pos += 1
@@ -204,5 +214,28 @@ class MyRolloutBuffer(BaseBuffer):
             self.advantages[batch_inds].flatten(),
             self.returns[batch_inds].flatten(),
         )
-        return RolloutBufferSamples(*tuple(map(self.to_torch, data)))
+        # the fancy indexing above already created new arrays, no need to copy them again before the upload
+        # observations stay uint8 until they are on the device, the policy normalizes them there (preprocess_obs)
+        return RolloutBufferSamples(self.observations_to_torch(data[0]), *tuple(self.to_torch(x, copy=False) for x in data[1:]))
+
+    def observations_to_torch(self, observations: np.ndarray) -> th.Tensor:
+        # the observations are by far the largest part of a minibatch
+        # on cuda they are copied from pinned memory without blocking, the upload overlaps with the preparation of the other arrays
+        # one pinned staging tensor per minibatch shape is reused, only the truncated last minibatch has a different shape
+        if self.device.type != "cuda":
+            return self.to_torch(observations, copy=False)
+
+        staging, last_upload = self._observation_staging.get(observations.shape, (None, None))
+        if staging is None:
+            staging = th.empty(observations.shape, dtype=th.from_numpy(observations).dtype, pin_memory=True)
+        elif last_upload is not None:
+            # the previous upload from the staging tensor has to be finished before it is overwritten
+            last_upload.synchronize()
+        staging.copy_(th.from_numpy(observations))
+
+        device_observations = staging.to(self.device, non_blocking=True)
+        upload = th.cuda.Event()
+        upload.record()
+        self._observation_staging[observations.shape] = (staging, upload)
+        return device_observations
 
@@ -26,6 +26,7 @@ from gymEnv.myEnums import SpawnOrientation
 from myPPO.episode_representation import EpisodeRepresentation
 from myPPO.episodes_results import EpisodesResults
 import collections
+from concurrent.futures import ThreadPoolExecutor
 
 import PIL.Image as Image
 
@@ -40,6 +41,11 @@ import yaml
 SelfOnPolicyAlgorithm = TypeVar(
     "SelfOnPolicyAlgorithm", bound="MyOnPolicyAlgorithm")
 
+# layout of the episode recordings, saved as format_version.npy in the episode_recordings folder
+# 1: one png per frame, actions, values and log_probs as separate .npy files (recordings without format_version.npy)
+# 2: all frames of an episode in one uint8 .npy file, actions, values and log_probs in tensors.npz
+RECORDING_FORMAT_VERSION = 2
+
 # what this code is based on:
 # https://stable-baselines3.readthedocs.io/en/master/_modules/stable_baselines3/common/on_policy_algorithm.html
 class MyOnPolicyAlgorithm(BaseAlgorithm):
@@ -80,6 +86,9 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
     rollout_buffer: MyRolloutBuffer
     policy: ActorCriticPolicy
 
+    # bound of the csv files that write_metric_rows keeps open
+    max_open_metric_files = 32
+
     def __init__(
         self,
         policy: Union[str, Type[ActorCriticPolicy]],
@@ -105,6 +114,8 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         use_bundled_calls: bool = False,
         use_fresh_obs: bool = False,
         print_network_and_loss_structure: bool = False,
+        use_compile: bool = False,
+        use_amp: bool = False,
     ):
         super().__init__(
             policy=policy,
@@ -133,10 +144,33 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         
         self.use_fresh_obs = use_fresh_obs
         self.print_network_and_loss_structure = print_network_and_loss_structure
+        # acting forward passes (rollouts and evaluation) and the training evaluate_actions through torch.compile
+        # see compile_policy_forward and myPPO.compile_policy_evaluate_actions
+        self.use_compile = use_compile
+        # rollout, evaluation and training forward passes in autocast (cuda only)
+        # bfloat16, or float16 with loss scaling on gpus without bfloat16 support
+        self.use_amp = use_amp
 
         self.max_total_success_rate = -1
 
         self.my_logs = {}
+        # maps metric to a dictionary of timestep -> value, only contains the values that were not dumped yet
+
+        self._created_prefixes = set()
+        # directories of the metric csv files that my_dump already created
+
+        self._metric_writers = collections.OrderedDict()
+        # metric -> (file, csv writer), the csv files stay open in append mode between the dumps
+        # at most max_open_metric_files are open, the least recently written one is closed first
+
+        self._dump_executor, self._pending_dump = None, None
+        # the csv rows of my_dump are written by a single background thread, at most one dump is pending
+
+        self._eval_results_cache = {}
+        # maps the settings of a basic evaluation run (including the timestep of the model) to (success_rate, collision_rate)
+
+        self._map_and_rotations_cache = {}
+        # maps (difficulty, n_eval_episodes, spawn mode) to the result of generate_map_and_rotations
 
         if _init_setup_model:
             self._setup_model()
@@ -165,11 +199,205 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         # pytype:enable=not-instantiable
         self.policy = self.policy.to(self.device)
 
+        # autocast of the forward passes, see forward_autocast
+        self._use_amp = getattr(self, "use_amp", False) and self.device.type == "cuda"
+        if getattr(self, "use_amp", False) and not self._use_amp:
+            print(f'WARNING: use_amp requires a cuda device, using float32', flush=True)
+        # gpus without bfloat16 support (pre ampere) use float16, its gradients in the training need loss scaling
+        # bfloat16 has the range of float32 and needs no scaling, the disabled scaler passes the loss and the optimizer step through unchanged
+        # without use_amp the (disabled) autocast keeps bfloat16, the only dtype cpu autocast supports
+        self._amp_dtype = th.float16 if self._use_amp and not th.cuda.is_bf16_supported() else th.bfloat16
+        self._grad_scaler = th.amp.GradScaler("cuda", enabled=self._use_amp and self._amp_dtype == th.float16)
+        # with autocast the convolutions run on the tensor cores, which work in channels last (NHWC)
+        # converting the weights and inputs once avoids the layout conversions inside cudnn for every conv
+        # only the 4d conv weights change their layout, the optimizer keeps referencing the same parameters
+        # gpus before volta (compute capability 7) have no tensor cores, there NCHW stays faster
+        self._channels_last = self._use_amp and isinstance(self.observation_space, spaces.Box) and len(self.observation_space.shape) == 3 and th.cuda.get_device_capability(self.device)[0] >= 7
+        if self._channels_last:
+            self.policy = self.policy.to(memory_format=th.channels_last)
+
+        # the forward pass used for acting, the training uses its own compiled evaluate_actions (see myPPO)
+        self._policy_forward = self.policy
+        if getattr(self, "use_compile", False):
+            self._policy_forward = self.compile_policy_forward()
+
+        # maps (env index, step number in the episode) to the corresponding position in rollout_buffer
+        # an episode never spans more than one rollout, since the envs are reset at the start of collect_rollouts
+        self._bufferpos_of_step = np.full((self.n_envs, self.n_steps), -1, dtype=np.int32)
+        # number of steps of the running episode of each env that are stored in self._bufferpos_of_step
+        self._episode_lengths = np.zeros(self.n_envs, dtype=np.int32)
+
+        # the action space does not change during a run, checked once instead of every step
+        self._action_space_is_box = isinstance(self.action_space, spaces.Box)
+
+        if self._action_space_is_box:
+            # bounds and output buffer for clipping the actions, allocated once instead of every step
+            self._action_low = np.asarray(self.action_space.low, dtype=np.float32)
+            self._action_high = np.asarray(self.action_space.high, dtype=np.float32)
+            self._clipped_actions = np.empty((self.n_envs, *self.action_space.shape), dtype=np.float32)
+            # the same bounds on the device, for clipping before the copy to the host where the unclipped actions are not needed
+            self._action_low_t = th.as_tensor(self._action_low, device=self.device)
+            self._action_high_t = th.as_tensor(self._action_high, device=self.device)
+
+        if self.device.type == "cuda" and isinstance(self.observation_space, spaces.Box):
+            # page-locked staging buffer, the copy to the gpu can then be done asynchronously via DMA
+            self._obs_host = th.from_numpy(np.zeros((self.n_envs, *self.observation_space.shape), dtype=self.observation_space.dtype)).pin_memory()
+            self._obs_device = th.empty_like(self._obs_host, device=self.device)
+        else:
+            self._obs_host, self._obs_device = None, None
+
+        # preallocated output for the fresh observations of get_obs_bundled_calls
+        # this is the memory of the pinned staging buffer if available, then obs_to_device does not need to copy it there
+        if self._obs_host is not None:
+            self._obs_scratch = self._obs_host.numpy()
+        elif isinstance(self.observation_space, spaces.Box):
+            self._obs_scratch = np.zeros((self.n_envs, *self.observation_space.shape), dtype=self.observation_space.dtype)
+        else:
+            self._obs_scratch = None
+
+        # two alternating output buffers for the observations of the bundled steps, see next_step_obs_buffer
+        if isinstance(self.observation_space, spaces.Box):
+            self._step_obs_buffers = [np.zeros((self.n_envs, *self.observation_space.shape), dtype=self.observation_space.dtype) for _ in range(2)]
+        else:
+            self._step_obs_buffers = None
+        self._step_obs_buffer_index = 0
+
+        if self.device.type == "cuda" and self._action_space_is_box:
+            # page-locked buffers for the outputs of the forward pass, avoids allocating new cpu tensors every step
+            self._actions_host = th.empty((self.n_envs, *self.action_space.shape), dtype=th.float32, pin_memory=True)
+            self._values_host = th.empty((self.n_envs, 1), dtype=th.float32, pin_memory=True)
+            self._log_probs_host = th.empty((self.n_envs,), dtype=th.float32, pin_memory=True)
+        else:
+            self._actions_host, self._values_host, self._log_probs_host = None, None, None
+
+    def _excluded_save_params(self) -> List[str]:
+        # the buffers and handles of _setup_model are recreated when the model is loaded, they are not saved
+        return super()._excluded_save_params() + [
+            "_bufferpos_of_step", "_episode_lengths", "_action_space_is_box", "_action_low", "_action_high", "_clipped_actions",
+            "_action_low_t", "_action_high_t", "_obs_host", "_obs_device", "_obs_scratch", "_step_obs_buffers",
+            "_actions_host", "_values_host", "_log_probs_host", "_policy_forward", "_policy_evaluate_actions",
+            "_eval_results_cache", "_map_and_rotations_cache", "_created_prefixes", "_metric_writers", "_dump_executor", "_pending_dump", "_use_amp", "_amp_dtype", "_grad_scaler", "_channels_last", "_envs_reset_for_rollout",
+        ]
+
+    def forward_autocast(self):
+        # context for the forward passes (rollouts, bootstrapping, evaluation and the training update), a no-op without use_amp
+        return th.autocast(device_type=self.device.type, dtype=self._amp_dtype, enabled=self._use_amp)
+
+    def compile_policy_forward(self):
+        # the rollouts and evaluations call the policy with the same shape (n_envs, C, H, W) every step
+        # reduce-overhead captures it with cuda graphs, the outputs are copied by outputs_to_host / actions_to_numpy right away
+        # falls back to the eager policy if torch.compile is not available or fails
+        if not hasattr(th, "compile"):
+            print(f'WARNING: use_compile requires torch>=2.0, using the eager policy', flush=True)
+            return self.policy
+
+        self.setup_compile_cache()
+        # one compiled callable per value of deterministic, switching between rollouts (sampling) and evaluation
+        # then only selects the callable instead of hitting the guards of a single specialized graph
+        policy = self.policy
+        compiled_policies = {
+            True: th.compile(lambda obs: policy(obs, deterministic=True), mode="reduce-overhead", dynamic=False),
+            False: th.compile(lambda obs: policy(obs, deterministic=False), mode="reduce-overhead", dynamic=False),
+        }
+
+        def compiled_policy(obs, deterministic=False):
+            return compiled_policies[bool(deterministic)](obs)
+
+        # warm up, the compilation is done here instead of during the first rollout
+        # the sampling consumes random numbers, the rng state of the seeded run is restored afterwards
+        dummy_obs = th.from_numpy(np.zeros((self.n_envs, *self.observation_space.shape), dtype=self.observation_space.dtype)).to(self.device)
+        if self._channels_last:
+            # same layout as the inputs of inferFromObservations, the graphs are specialized on the strides
+            dummy_obs = dummy_obs.contiguous(memory_format=th.channels_last)
+        self.policy.set_training_mode(False)
+        try:
+            with th.random.fork_rng(devices=[self.device] if self.device.type == "cuda" else []), th.inference_mode(), self.forward_autocast():
+                for deterministic in (True, False):
+                    for _ in range(2):
+                        compiled_policy(dummy_obs, deterministic=deterministic)
+        except Exception as e:
+            print(f'WARNING: torch.compile of the policy failed, using the eager policy: {e}', flush=True)
+            return self.policy
+
+        return compiled_policy
+
+    def setup_compile_cache(self):
+        # the compiled kernels are kept across runs, only the first run pays the compile time
+        # not in the working directory, hydra creates a new one for every run
+        # an already set TORCHINDUCTOR_CACHE_DIR is kept
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.expanduser("~/.cache/carsim_inductor"))
+        # the policy is called with deterministic=True and False (rollouts, evaluation, replay)
+        # every combination is its own specialization, the default limit (8) could be reached and torch would fall back to eager
+        if th._dynamo.config.cache_size_limit < 64:
+            th._dynamo.config.cache_size_limit = 64
+
+    def next_step_obs_buffer(self):
+        # output buffer for the observations of step_wrapper, alternates between two arrays
+        # the observations of a step are kept as _last_obs and read by the forward pass and rollout_buffer.add of the next step
+        # while that step already writes its observations, they are overwritten two steps later
+        if self._step_obs_buffers is None:
+            return None
+        self._step_obs_buffer_index = 1 - self._step_obs_buffer_index
+        return self._step_obs_buffers[self._step_obs_buffer_index]
+
+    def obs_to_device(self, obs):
+        # like obs_as_tensor, but uses the pinned staging buffer for the observations of all envs
+        # the returned tensor is overwritten by the next call, do not keep references to it
+        if self._obs_host is None or obs.shape != self._obs_host.shape:
+            return obs_as_tensor(obs, self.device)
+
+        if obs is not self._obs_scratch:
+            self._obs_host.copy_(th.from_numpy(obs))
+        self._obs_device.copy_(self._obs_host, non_blocking=True)
+        return self._obs_device
+
+    def actions_to_numpy(self, actions):
+        # like actions.cpu().numpy(), but copies into the pinned actions buffer (used during evaluation, where only the actions are needed)
+        # the returned array is overwritten by the next call, do not keep references to it
+        if self._actions_host is None or actions.shape != self._actions_host.shape:
+            return actions.cpu().numpy()
+
+        self._actions_host.copy_(actions, non_blocking=True)
+        # only wait for the work queued so far on this stream (forward pass, clipping and the copy)
+        th.cuda.current_stream(self.device).synchronize()
+        return self._actions_host.numpy()
+
+    def outputs_to_host(self, actions, values, log_probs):
+        # copies the outputs of the forward pass into the pinned buffers with a single synchronization
+        # values and log_probs are only needed by rollout_buffer.add after env.step, without this each of them
+        # would be another blocking device to host copy after the step
+        # returns actions as numpy array and values, log_probs as cpu tensors (as expected by rollout_buffer.add)
+        # the returned objects are overwritten by the next call, do not keep references to them
+        if self._actions_host is None or actions.shape != self._actions_host.shape \
+                or values.shape != self._values_host.shape or log_probs.shape != self._log_probs_host.shape:
+            return actions.cpu().numpy(), values, log_probs
+
+        self._actions_host.copy_(actions, non_blocking=True)
+        self._values_host.copy_(values, non_blocking=True)
+        self._log_probs_host.copy_(log_probs, non_blocking=True)
+        # only wait for the work queued so far on this stream (forward pass and the copies)
+        th.cuda.current_stream(self.device).synchronize()
+        return self._actions_host.numpy(), self._values_host, self._log_probs_host
+
+    def reset_envs(self, env, indices, reset_kwargs):
+        # resets the envs with the given indices, reset_kwargs contains the keyword arguments of BaseCarsimEnv.reset for each index
+        # with bundled calls this is a single request to unity for all envs instead of one per env
+        if len(indices) == 0:
+            return
+
+        if self.use_bundled_calls:
+            reset_bundled_calls(env, indices, reset_kwargs)
+        else:
+            for idx, kwargs in zip(indices, reset_kwargs):
+                env.env_method(method_name="reset", indices=[idx], **kwargs)
+
     def inferFromObservations(self, env, deterministic, use_fresh_obs):
         # moved to its own function to be able to profile the forward passes (during rollout collection and evaluation) easily
+        # inference_mode instead of no_grad: the outputs are never used for backprop (the losses are recomputed in train)
+        # so torch can also skip the version counter and view tracking
 
 
-        with th.no_grad():
+        with th.inference_mode():
             # Convert to pytorch tensor or to TensorDict
 
             #print(f'using fresh obs: {self.use_fresh_obs} use_bundled_calls {self.use_bundled_calls}', flush=True)
@@ -177,26 +405,35 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             if use_fresh_obs:
 
                 if self.use_bundled_calls:
-                    obs = get_obs_bundled_calls(env)
+                    # obs is overwritten by the next call, it is only used until it is stored in the rollout buffer
+                    obs = get_obs_bundled_calls(env, out=self._obs_scratch)
                 else:
                     obs = get_obs_single_calls(env)
             
                 #print(f'fresh_obs shape: {fresh_obs.shape}', flush=True)
-                obs_tensor = obs_as_tensor(obs, self.device)
+                obs_tensor = self.obs_to_device(obs)
             else:
 
                 # we use the obs from the last step, no fresh collection
                 # this is how it was originally done in sb3 and uses less calls to unity
-                obs_tensor = obs_as_tensor(self._last_obs, self.device)
+                obs_tensor = self.obs_to_device(self._last_obs)
                 obs = self._last_obs
 
-            actions, values, log_probs = self.policy(obs_tensor, deterministic=deterministic)
+            if self._channels_last:
+                # the uint8 observations are converted on the device, the float conversion of the policy keeps the layout
+                obs_tensor = obs_tensor.contiguous(memory_format=th.channels_last)
+
+            with self.forward_autocast():
+                actions, values, log_probs = self._policy_forward(obs_tensor, deterministic=deterministic)
+            if self._use_amp:
+                # the buffers and numpy expect float32, numpy has no bfloat16
+                actions, values, log_probs = actions.float(), values.float(), log_probs.float()
         
         return actions, values, log_probs, obs
     
     def inferFromObservationsForRecording(self, env, deterministic):
 
-        with th.no_grad():
+        with th.inference_mode():
             # Convert to pytorch tensor or to TensorDict
 
             obs, all_obsstrings = get_obs_bundled_calls(env, return_all_obsstrings=True)
@@ -221,6 +458,8 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         # do not use no_grad here
         # Convert to pytorch tensor or to TensorDict
         fresh_obs = get_obs_single_calls(env)
+        # fetching the observations advances the frame stacking memory of the envs, the next rollout has to reset them
+        self._envs_reset_for_rollout = False
         obs_tensor = obs_as_tensor(fresh_obs, self.device)
 
         actions, values, log_probs = self.policy(obs_tensor)
@@ -260,8 +499,9 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             collected, False if callback terminated rollout prematurely.
         """
 
-        print(f'collect rollouts started', flush=True)
-        cr_time = time.time() 
+        if self.verbose >= 1:
+            print(f'collect rollouts started', flush=True)
+        cr_time = time.perf_counter() 
 
         # Switch to eval mode (this affects batch norm / dropout)
         self.policy.set_training_mode(False)
@@ -276,19 +516,27 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         
         episodes_results = EpisodesResults()
+        # the infos of the finished episodes are processed in one pass after the rollout
+        finished_episode_infos = []
 
         total_timesteps = 0
         
 
-        reward_correction_dict = {}
-        for i in range(env.num_envs):
-            reward_correction_dict[i] = {}
-        # outer dictionary maps env index to inner dictionary
-        # inner dictionary maps step number to the corresponding position in rollout_buffer
+        # preallocated in _setup_model, only reset for every rollout
+        # the episode length is also the step number (info['step']) of the next step of each env
+        episode_lengths = self._episode_lengths
+        episode_lengths.fill(0)
+        env_indices = np.arange(env.num_envs)
 
         
-        new_obs = env.reset()
         # we need to reset the env to get the correct rewards
+        # the episodes must not span multiple rollouts, see self._bufferpos_of_step
+        if getattr(self, "_envs_reset_for_rollout", False):
+            # the envs were just reset by _setup_learn and not stepped since, a second reset is not needed
+            self._envs_reset_for_rollout = False
+            new_obs = self._last_obs
+        else:
+            new_obs = env.reset()
 
         if not self.use_fresh_obs:
             self._last_obs = new_obs
@@ -302,16 +550,17 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
             actions, values, log_probs, obs = self.inferFromObservations(env, deterministic=False, use_fresh_obs=self.use_fresh_obs)
 
-            actions = actions.cpu().numpy()
+            actions, values, log_probs = self.outputs_to_host(actions, values, log_probs)
 
             # Rescale and perform action
             clipped_actions = actions
             # Clip the actions to avoid out of bound error
-            if isinstance(self.action_space, spaces.Box):
+            # the unclipped actions are stored in the rollout buffer, so we clip into a separate buffer
+            if self._action_space_is_box:
                 clipped_actions = np.clip(
-                    actions, self.action_space.low, self.action_space.high)
+                    actions, self._action_low, self._action_high, out=self._clipped_actions)
 
-            new_obs, rewards, dones, infos = step_wrapper(env, clipped_actions, self.use_bundled_calls)
+            new_obs, rewards, dones, infos = step_wrapper(env, clipped_actions, self.use_bundled_calls, out=self.next_step_obs_buffer())
             #print(f'observations shape: {new_obs.shape} {type(new_obs)}')
             #print(f'rewards shape: {rewards.shape} {type(rewards)}')
             #print(f'dones shape: {dones.shape} {type(dones)}')
@@ -329,32 +578,39 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             if callback.on_step() is False:
                 return False
 
-            self._update_info_buffer(infos)
             n_steps += 1
 
             if isinstance(self.action_space, spaces.Discrete):
                 # Reshape in case of discrete action
                 actions = actions.reshape(-1, 1)
 
+            done_indices = np.flatnonzero(dones)
+
+            # single pass over the infos of the finished episodes
+            # only these contain episode information, the others are not relevant for _update_info_buffer
+            done_infos, truncated_indices = [], []
+            for idx in done_indices:
+                info = infos[idx]
+                done_infos.append(info)
+
+                if info.get("terminal_observation") is not None and info.get("TimeLimit.truncated", False):
+                    truncated_indices.append(idx)
+
+            if len(done_infos) > 0:
+                self._update_info_buffer(done_infos, np.ones(len(done_infos), dtype=bool))
+                finished_episode_infos.extend(done_infos)
+
             # Handle timeout by bootstraping with value function
             # see GitHub issue #633
-            for idx, done in enumerate(dones):
-                if (
-                    done
-                    and infos[idx].get("terminal_observation") is not None
-                    and infos[idx].get("TimeLimit.truncated", False)
-                ):
-                    terminal_obs = self.policy.obs_to_tensor(
-                        infos[idx]["terminal_observation"])[0]
-                    with th.no_grad():
-                        terminal_value = self.policy.predict_values(
-                            terminal_obs)[0]  # type: ignore[arg-type]
-                    rewards[idx] += self.gamma * terminal_value
-
-                if done:
-                    episodes_results.processInfoDictEpisodeFinished(infos[idx])
-                    
-                    
+            if len(truncated_indices) > 0:
+                # a single upload and forward pass for all truncated episodes of this step
+                # the terminal observations are already batched, the shape checks of policy.obs_to_tensor are not needed
+                terminal_obs = obs_as_tensor(
+                    np.stack([infos[idx]["terminal_observation"] for idx in truncated_indices]), self.device)
+                with th.inference_mode(), self.forward_autocast():
+                    terminal_values = self.policy.predict_values(
+                        terminal_obs).float().cpu().numpy().flatten()  # type: ignore[arg-type]
+                rewards[truncated_indices] += self.gamma * terminal_values
 
             insertpos = rollout_buffer.add(
                 obs,  # type: ignore[arg-type]
@@ -366,112 +622,111 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             )
             #print(f'insertpos: {insertpos}')
 
-            assert len(infos) == env.num_envs, f"infos has wrong length {len(infos)} != {env.num_envs}"
+            if __debug__ and self.verbose >= 2:
+                # consistency checks of the step numbers, these are too expensive for every run
+                assert len(infos) == env.num_envs, f"infos has wrong length {len(infos)} != {env.num_envs}"
+                steps = np.array([int(info['step']) for info in infos], dtype=np.int32)
+                assert np.array_equal(steps, episode_lengths), f"steps {steps} are not the next steps of the envs, expected {episode_lengths}"
 
-            for idx, info in enumerate(infos):
+            self._bufferpos_of_step[env_indices, episode_lengths] = insertpos
+            episode_lengths += 1
 
-                assert int(info['step']) not in reward_correction_dict[idx].keys(), f"step {info['step']} already in reward correction dict for env {idx}"
-                if int(info['step']) != 0:
-                    #print(f'info["step"]: {info["step"]}')
-                    #print(f'reward_correction_dict[idx]: {reward_correction_dict[idx]}')
-                    #print(f'done: {dones[idx]}')
-                    assert int(info["step"]) == max(reward_correction_dict[idx].keys()) + 1, f"step {info['step']} is not the next step in reward correction dict for env {idx}: {reward_correction_dict[idx]}"
-                
-                reward_correction_dict[idx][int(info['step'])] = insertpos
-
-            for idx, done in enumerate(dones):
-                # obtain the real rewards from the env
-                if done:
-                    self.collected_episodes += 1
-
-                if done or n_steps >= n_rollout_steps:
-
-                    env_id = idx
-                    rewards = infos[env_id]['rewards']
-                    assert len(rewards) == len(reward_correction_dict[env_id]), f"rewards {len(rewards)} and reward correction dict {len(reward_correction_dict[env_id])} do not match in length"
-                    for step, bufferpos in reward_correction_dict[env_id].items():
-                        rollout_buffer.rewards[bufferpos][env_id] = rewards[step]
+            self.collected_episodes += len(done_indices)
 
+            # obtain the real rewards from the env
+            # at the end of the rollout the unfinished episodes are corrected as well
+            if n_steps >= n_rollout_steps:
+                correction_indices = env_indices
+            else:
+                correction_indices = done_indices
 
-                    assert len(reward_correction_dict[env_id]) == int(infos[idx]['amount_of_steps']), f"reward correction dict is not complete {len(reward_correction_dict[env_id])} != {infos[idx]['amount_of_steps']}"
+            if len(correction_indices) > 0:
+                # the env provides the rewards as lists (they are also written to the endInfo.yml files), converted once here
+                episode_rewards = [np.asarray(infos[env_id]['rewards'], dtype=np.float32) for env_id in correction_indices]
+                if __debug__ and self.verbose >= 2:
+                    # a length mismatch also fails the scatter in correct_rewards, these checks give the more helpful message
+                    for env_id, rewards_of_env in zip(correction_indices, episode_rewards):
+                        assert len(rewards_of_env) == episode_lengths[env_id], f"rewards {len(rewards_of_env)} and stored buffer positions {episode_lengths[env_id]} do not match in length"
+                        assert episode_lengths[env_id] == int(infos[env_id]['amount_of_steps']), f"stored buffer positions are not complete {episode_lengths[env_id]} != {infos[env_id]['amount_of_steps']}"
 
-                    # reset the reward correction dict
-                    reward_correction_dict[env_id] = {}
-                
-                if done and self.use_bundled_calls:
-                    env.envs[idx].reset()
-                    # we need to do the reset here, since our bundled calls do not reset by themselves
+                correct_rewards(rollout_buffer.rewards, self._bufferpos_of_step, episode_lengths, correction_indices, episode_rewards)
 
+            if self.use_bundled_calls:
+                # we need to do the reset here, since our bundled calls do not reset by themselves
+                reset_bundled_calls(env, done_indices)
 
-            
             self._last_episode_starts = dones
             if not self.use_fresh_obs:
                 self._last_obs = new_obs
 
-        with th.no_grad():
+        with th.inference_mode(), self.forward_autocast():
             # Compute value for the last timestep
-            values = self.policy.predict_values(obs_as_tensor(
-                new_obs, self.device))  # type: ignore[arg-type]
+            values = self.policy.predict_values(self.obs_to_device(
+                new_obs)).float()  # type: ignore[arg-type]
 
         rollout_buffer.compute_returns_and_advantage(
             last_values=values, dones=dones)
 
         callback.on_rollout_end()
 
-        
+        episodes_results.processInfoDictsEpisodesFinished(finished_episode_infos)
         episodes_results.computeRates()
         
         
-        self.my_record("rollout/success_rate", episodes_results.success_rate)
-        self.my_record("rollout/timeout_rate", episodes_results.timeout_rate)
-        self.my_record("rollout/goal_completion_rate", episodes_results.goal_completion_rate)
-        self.my_record("rollout/mean_reward", episodes_results.mean_reward)
-        self.my_record("rollout/mean_episode_length", episodes_results.mean_episode_length)
-        self.my_record("rollout/mean_distance_reward", episodes_results.mean_distance_reward)
-        self.my_record("rollout/mean_velocity_reward", episodes_results.mean_velocity_reward)
-        self.my_record("rollout/mean_orientation_reward", episodes_results.mean_orientation_reward)
-        self.my_record("rollout/mean_event_reward", episodes_results.mean_event_reward)
-        self.my_record("rollout/first_goal_completion_rate", episodes_results.first_goal_completion_rate)
-        self.my_record("rollout/second_goal_completion_rate", episodes_results.second_goal_completion_rate)
-        self.my_record("rollout/third_goal_completion_rate", episodes_results.third_goal_completion_rate)
-
-        self.my_record("rollout/completed_episodes", episodes_results.completed_episodes)
-        self.my_record("rollout/rate_finishLineHit", episodes_results.rate_finishLineHit)
-
-        step_average_wait_time = episodes_results.waitTime / total_timesteps
-        self.my_record("rollout/step_average_wait_time", step_average_wait_time)
-        self.my_record("rollout/rate_episodes_with_collisions", episodes_results.rate_episodes_with_collisions)
-        self.my_record("rollout/avg_step_duration_unity", episodes_results.avg_step_duration_unity_env) # average duration of a step measured in unity episode duration time
-
-        self.my_record("prescalerewards/mean_distance_reward", episodes_results.mean_prescale_distance_reward)
-        self.my_record("prescalerewards/mean_velocity_reward", episodes_results.mean_prescale_velocity_reward)
-        self.my_record("prescalerewards/mean_orientation_reward", episodes_results.mean_prescale_orientation_reward)
-        self.my_record("prescalerewards/mean_event_reward", episodes_results.mean_prescale_event_reward)
-
-        self.my_record("rollout_collisions/collision_rate", episodes_results.collision_rate)
-        self.my_record("rollout_collisions/obstacle_collision_rate", episodes_results.obstacle_collision_rate)
-        self.my_record("rollout_collisions/wall_collision_rate", episodes_results.wall_collision_rate)
-        self.my_record("rollout_collisions/collision_rate_succesful_episodes", episodes_results.collision_rate_succesful_episodes)
-
-        self.my_record("rollout_success/success_rate", episodes_results.success_rate)
-        self.my_record("rollout_success/goal_completion_rate", episodes_results.goal_completion_rate)
+        metrics = {
+            "rollout/success_rate": episodes_results.success_rate,
+            "rollout/timeout_rate": episodes_results.timeout_rate,
+            "rollout/goal_completion_rate": episodes_results.goal_completion_rate,
+            "rollout/mean_reward": episodes_results.mean_reward,
+            "rollout/mean_episode_length": episodes_results.mean_episode_length,
+            "rollout/mean_distance_reward": episodes_results.mean_distance_reward,
+            "rollout/mean_velocity_reward": episodes_results.mean_velocity_reward,
+            "rollout/mean_orientation_reward": episodes_results.mean_orientation_reward,
+            "rollout/mean_event_reward": episodes_results.mean_event_reward,
+            "rollout/first_goal_completion_rate": episodes_results.first_goal_completion_rate,
+            "rollout/second_goal_completion_rate": episodes_results.second_goal_completion_rate,
+            "rollout/third_goal_completion_rate": episodes_results.third_goal_completion_rate,
+
+            "rollout/completed_episodes": episodes_results.completed_episodes,
+            "rollout/rate_finishLineHit": episodes_results.rate_finishLineHit,
+
+            "rollout/step_average_wait_time": episodes_results.waitTime / total_timesteps,
+            "rollout/rate_episodes_with_collisions": episodes_results.rate_episodes_with_collisions,
+            "rollout/avg_step_duration_unity": episodes_results.avg_step_duration_unity_env, # average duration of a step measured in unity episode duration time
+
+            "prescalerewards/mean_distance_reward": episodes_results.mean_prescale_distance_reward,
+            "prescalerewards/mean_velocity_reward": episodes_results.mean_prescale_velocity_reward,
+            "prescalerewards/mean_orientation_reward": episodes_results.mean_prescale_orientation_reward,
+            "prescalerewards/mean_event_reward": episodes_results.mean_prescale_event_reward,
+
+            "rollout_collisions/collision_rate": episodes_results.collision_rate,
+            "rollout_collisions/obstacle_collision_rate": episodes_results.obstacle_collision_rate,
+            "rollout_collisions/wall_collision_rate": episodes_results.wall_collision_rate,
+            "rollout_collisions/collision_rate_succesful_episodes": episodes_results.collision_rate_succesful_episodes,
+
+            "rollout_success/success_rate": episodes_results.success_rate,
+            "rollout_success/goal_completion_rate": episodes_results.goal_completion_rate,
+
+            "rollout_episodes/rate_easy_episodes": episodes_results.rate_easy_episodes,
+            "rollout_episodes/rate_medium_episodes": episodes_results.rate_medium_episodes,
+            "rollout_episodes/rate_hard_episodes": episodes_results.rate_hard_episodes,
+        }
         if episodes_results.num_easy_episodes != 0:
-            self.my_record("rollout_success/success_rate_easy", episodes_results.easy_success_rate)
-            self.my_record("rollout_success/goal_completion_rate_easy", episodes_results.easy_goal_completion_rate)
+            metrics["rollout_success/success_rate_easy"] = episodes_results.easy_success_rate
+            metrics["rollout_success/goal_completion_rate_easy"] = episodes_results.easy_goal_completion_rate
         if episodes_results.num_medium_episodes != 0:
-            self.my_record("rollout_success/success_rate_medium", episodes_results.medium_success_rate)
-            self.my_record("rollout_success/goal_completion_rate_medium", episodes_results.medium_goal_completion_rate)
+            metrics["rollout_success/success_rate_medium"] = episodes_results.medium_success_rate
+            metrics["rollout_success/goal_completion_rate_medium"] = episodes_results.medium_goal_completion_rate
         if episodes_results.num_hard_episodes != 0:
-            self.my_record("rollout_success/success_rate_hard", episodes_results.hard_success_rate)
-            self.my_record("rollout_success/goal_completion_rate_hard", episodes_results.hard_goal_completion_rate)
-        
-        self.my_record("rollout_episodes/rate_easy_episodes", episodes_results.rate_easy_episodes)
-        self.my_record("rollout_episodes/rate_medium_episodes", episodes_results.rate_medium_episodes)
-        self.my_record("rollout_episodes/rate_hard_episodes", episodes_results.rate_hard_episodes)
+            metrics["rollout_success/success_rate_hard"] = episodes_results.hard_success_rate
+            metrics["rollout_success/goal_completion_rate_hard"] = episodes_results.hard_goal_completion_rate
+
+        self.my_record_dict(metrics)
 
-        cr_time = time.time() - cr_time
+        cr_time = time.perf_counter() - cr_time
         
-        print(f'collect rollouts finished with {episodes_results.completed_episodes} episodes in {cr_time} seconds', flush=True)
+        if self.verbose >= 1:
+            print(f'collect rollouts finished with {episodes_results.completed_episodes} episodes in {cr_time} seconds', flush=True)
 
         if episodes_results.success_rate >= self.rollout_best_success_rate:
             self.rollout_best_success_rate = episodes_results.success_rate
@@ -483,33 +738,69 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         return True, cr_time
     
     def my_record(self, key: str, value: float, exclude = None) -> None:
-        x = self.num_timesteps
-        if key not in self.my_logs.keys():
-            self.my_logs[key] = {}
+        self.my_logs.setdefault(key, {})[self.num_timesteps] = value
+        self.logger.record(key, value, exclude=exclude)
 
-        self.my_logs[key][x] = value
-
-        if exclude == None:
-            self.logger.record(key, value)
-        else: 
+    def my_record_dict(self, metrics: Dict[str, float], exclude = None) -> None:
+        # records multiple metrics for the same timestep in one pass
+        x = self.num_timesteps
+        for key, value in metrics.items():
+            self.my_logs.setdefault(key, {})[x] = value
             self.logger.record(key, value, exclude=exclude)
 
     def my_dump(self, step: int) -> None:
-        for metric, dictionary in self.my_logs.items():
+        # the rows are written in the background while the next rollout or evaluation runs
+        # waiting for the previous dump keeps the rows in order and raises its errors here
+        self.wait_for_pending_dump()
+        if self._dump_executor is None:
+            self._dump_executor = ThreadPoolExecutor(max_workers=1)
 
-            prefix = metric.split("/")[0]
+        logs, self.my_logs = self.my_logs, {}
+        self._pending_dump = self._dump_executor.submit(self.write_metric_rows, logs)
 
-            if not os.path.exists(prefix):
-                os.makedirs(prefix)
+        self.logger.dump(step=step)
 
-            file_path = f'{metric}.csv'
+    def wait_for_pending_dump(self) -> None:
+        if self._pending_dump is not None:
+            self._pending_dump.result()
+            self._pending_dump = None
 
-            with open(file_path, 'w', newline='') as file:
-                writer = csv.writer(file)
-                for timestep, value in dictionary.items():
-                    writer.writerow([timestep, value])
+    def write_metric_rows(self, logs) -> None:
+        # appends the values of logs (metric -> {timestep: value}) to the csv files of the metrics
+        for metric, dictionary in logs.items():
 
-        self.logger.dump(step=step)
+            prefix = metric.split("/")[0]
+
+            if prefix not in self._created_prefixes:
+                os.makedirs(prefix, exist_ok=True)
+                self._created_prefixes.add(prefix)
+
+            if metric in self._metric_writers:
+                self._metric_writers.move_to_end(metric)
+            else:
+                if len(self._metric_writers) >= self.max_open_metric_files:
+                    # the metric names contain the difficulty, light setting and iteration, their number keeps growing
+                    _, (evicted_file, _) = self._metric_writers.popitem(last=False)
+                    evicted_file.close()
+                file = open(f'{metric}.csv', 'a', newline='')
+                self._metric_writers[metric] = (file, csv.writer(file))
+            file, writer = self._metric_writers[metric]
+
+            # only the new values are appended, the previous ones are already in the file
+            writer.writerows([timestep, value] for timestep, value in dictionary.items())
+            # the files stay open, the rows are on disk after every dump
+            file.flush()
+
+    def close_metric_writers(self) -> None:
+        # the files are only closed after the background dump finished writing to them
+        # the next dump opens the files again in append mode and starts a new worker
+        self.wait_for_pending_dump()
+        for file, _ in self._metric_writers.values():
+            file.close()
+        self._metric_writers.clear()
+        if self._dump_executor is not None:
+            self._dump_executor.shutdown()
+            self._dump_executor = None
 
 
     def train(self) -> None:
@@ -537,6 +828,10 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         assert self.env is not None
 
+        # _setup_learn resets the envs in these cases, the first rollout can start from its observations
+        # as long as nothing queries or steps the envs in between (see print_network_structure)
+        envs_reset_by_setup_learn = reset_num_timesteps or self._last_obs is None
+
         total_timesteps, callback = self._setup_learn(
             total_timesteps,
             callback,
@@ -544,6 +839,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             tb_log_name,
             progress_bar,
         )
+        self._envs_reset_for_rollout = envs_reset_by_setup_learn
 
 
         if self.print_network_and_loss_structure:
@@ -551,7 +847,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
 
         callback.on_training_start(locals(), globals())
-        learn_starttime = time.time()
+        learn_starttime = time.perf_counter()
 
         total_cr_time, total_train_time, total_eval_time = 0, 0, 0
         self.collected_episodes = 0
@@ -599,41 +895,42 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
                 # fps takes the time for the whole training, collect_rollout_fps_per_env only counts collection time
                 collect_rollout_fps_per_env = float(((self.num_timesteps - self._num_timesteps_at_start) / self.n_envs ) / total_collection_time)
 
-                self.my_record("time/iterations",
-                                   iteration, exclude="tensorboard")
                 '''if len(self.ep_info_buffer) > 0 and len(self.ep_info_buffer[0]) > 0:
                     self.logger.record(
                         "rollout/ep_rew_mean", safe_mean([ep_info["r"] for ep_info in self.ep_info_buffer]))
                     self.logger.record(
                         "rollout/ep_len_mean", safe_mean([ep_info["l"] for ep_info in self.ep_info_buffer]))'''
-                self.my_record("time/fps", fps)
-                self.my_record("time/fps_per_env", fps_per_env)
-                self.my_record("time/collect_rollout_fps_per_env", collect_rollout_fps_per_env)
-
-                self.my_record("time/time_elapsed",
-                                   int(time_elapsed), exclude="tensorboard")
-                self.my_record("time/total_timesteps",
-                                   self.num_timesteps, exclude="tensorboard")
-                self.my_record("rollout/collected_episodes", self.collected_episodes)
-
-                self.my_record("time/collection_time_seconds", cr_time)
-                self.my_record("time/iteration", iteration)
-                self.my_record("time/timesteps_per_hour_realtime", self.num_timesteps / ((time.time()-learn_starttime) / 3600)) # this includes the train and eval time ...
+                # one batch per exclude setting instead of one my_record call per metric
+                self.my_record_dict({
+                    "time/iterations": iteration,
+                    "time/time_elapsed": int(time_elapsed),
+                    "time/total_timesteps": self.num_timesteps,
+                }, exclude="tensorboard")
+                self.my_record_dict({
+                    "time/fps": fps,
+                    "time/fps_per_env": fps_per_env,
+                    "time/collect_rollout_fps_per_env": collect_rollout_fps_per_env,
+                    "rollout/collected_episodes": self.collected_episodes,
+                    "time/collection_time_seconds": cr_time,
+                    "time/iteration": iteration,
+                    "time/timesteps_per_hour_realtime": self.num_timesteps / ((time.perf_counter()-learn_starttime) / 3600), # this includes the train and eval time ...
+                })
 
                 self.my_dump(step=self.num_timesteps)
 
-            train_time = time.time()
+            train_time = time.perf_counter()
             self.train()
-            train_time = time.time() - train_time
+            train_time = time.perf_counter() - train_time
             self.my_record("time/train_time_minutes", train_time / 60)
             self.my_dump(step=self.num_timesteps)
             
             total_train_time += train_time
 
-            print(f'total_cr_time in minutes: {total_cr_time / 60}')
-            print(f'total_train_time in minutes: {total_train_time / 60}')
+            if self.verbose >= 1:
+                print(f'total_cr_time in minutes: {total_cr_time / 60}\ntotal_train_time in minutes: {total_train_time / 60}')
 
         callback.on_training_end()
+        self.close_metric_writers()
 
         return self
 
@@ -643,7 +940,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         return state_dicts, []
     
     def test_deterministic_improves(self, n_episodes: int = 10, iteration: int = 0, log =False) -> float:
-        dirpath=f'{os.getcwd()}\\videos_iter_{iteration}'
+        dirpath = os.path.join(os.getcwd(), f'videos_iter_{iteration}')
         if not os.path.exists(dirpath):
             os.mkdir(dirpath)
 
@@ -657,10 +954,14 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         for light_setting in light_settings:
 
+            # all difficulties in one run each, this keeps all envs busy until the last episodes
+            deter_results = self.basic_evaluation_algorithm_multi(n_episodes, difficulties, iteration, light_setting, deterministic=True)
+            nondeter_results = self.basic_evaluation_algorithm_multi(n_episodes, difficulties, iteration, light_setting, deterministic=False)
+
             for difficulty in difficulties:
 
-                deter_success_rate, deter_collision_rate = self.basic_evaluation_algorithm(n_episodes, difficulty, iteration, light_setting, deterministic=True)
-                nondeter_success_rate, nondeter_collision_rate = self.basic_evaluation_algorithm(n_episodes, difficulty, iteration, light_setting, deterministic=False)
+                deter_success_rate, deter_collision_rate = deter_results[difficulty]
+                nondeter_success_rate, nondeter_collision_rate = nondeter_results[difficulty]
 
                 total_deter_success_rate += deter_success_rate
                 total_deter_collision_rate += deter_collision_rate
@@ -668,12 +969,14 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
                 total_nondeter_collision_rate += nondeter_collision_rate
 
                 if log:
-                    self.my_record(f"deter_nondeter_comparison/success_deter_{difficulty}_{light_setting.name}", deter_success_rate)
-                    self.my_record(f"deter_nondeter_comparison/success_nondeter_{difficulty}_{light_setting.name}", nondeter_success_rate)
-                    self.my_record(f"deter_nondeter_comparison/collision_rate_deter_{difficulty}_{light_setting.name}", deter_collision_rate)
-                    self.my_record(f"deter_nondeter_comparison/collision_rate_nondeter_{difficulty}_{light_setting.name}", nondeter_collision_rate)
-
-                    self.my_record(f"deter_nondeter_comparison/nondeter_better_by_{difficulty}_{light_setting.name}", nondeter_success_rate - deter_success_rate)
+                    self.my_record_dict({
+                        f"deter_nondeter_comparison/success_deter_{difficulty}_{light_setting.name}": deter_success_rate,
+                        f"deter_nondeter_comparison/success_nondeter_{difficulty}_{light_setting.name}": nondeter_success_rate,
+                        f"deter_nondeter_comparison/collision_rate_deter_{difficulty}_{light_setting.name}": deter_collision_rate,
+                        f"deter_nondeter_comparison/collision_rate_nondeter_{difficulty}_{light_setting.name}": nondeter_collision_rate,
+
+                        f"deter_nondeter_comparison/nondeter_better_by_{difficulty}_{light_setting.name}": nondeter_success_rate - deter_success_rate,
+                    })
                     
 
         total_deter_success_rate /= len(light_settings) * len(difficulties)
@@ -689,22 +992,24 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         # it might not be needed for our task, as we have different start rotations
         # ----> we use non-determinsitc
 
-        self.my_record(f"deter_nondeter_comparison/success_deter", total_deter_success_rate)
-        self.my_record(f"deter_nondeter_comparison/success_nondeter", total_nondeter_success_rate)
-        self.my_record(f"deter_nondeter_comparison/collision_rate_deter", total_deter_collision_rate)
-        self.my_record(f"deter_nondeter_comparison/collision_rate_nondeter", total_nondeter_collision_rate)
-        self.my_record(f"deter_nondeter_comparison/nondeter_success_rate_better", total_nondeter_success_rate - total_deter_success_rate)
-        self.my_record(f"deter_nondeter_comparison/nondeter_collision_rate_better", total_nondeter_collision_rate - total_deter_collision_rate)
+        self.my_record_dict({
+            f"deter_nondeter_comparison/success_deter": total_deter_success_rate,
+            f"deter_nondeter_comparison/success_nondeter": total_nondeter_success_rate,
+            f"deter_nondeter_comparison/collision_rate_deter": total_deter_collision_rate,
+            f"deter_nondeter_comparison/collision_rate_nondeter": total_nondeter_collision_rate,
+            f"deter_nondeter_comparison/nondeter_success_rate_better": total_nondeter_success_rate - total_deter_success_rate,
+            f"deter_nondeter_comparison/nondeter_collision_rate_better": total_nondeter_collision_rate - total_deter_collision_rate,
+        })
 
 
-    def basic_evaluation_algorithm_wrapper_freshObs(self, n_episodes, difficulty, iteration, light_setting):
-        return self.basic_evaluation_algorithm(n_episodes, difficulty, iteration, light_setting, use_fresh_obs=True, record_videos=True)
+    def basic_evaluation_algorithm_wrapper_freshObs(self, n_episodes, difficulties, iteration, light_setting):
+        return self.basic_evaluation_algorithm_multi(n_episodes, difficulties, iteration, light_setting, use_fresh_obs=True, record_videos=True)
     
-    def basic_evaluation_algorithm_wrapper_noFreshObs(self, n_episodes, difficulty, iteration, light_setting):
-        return self.basic_evaluation_algorithm(n_episodes, difficulty, iteration, light_setting, use_fresh_obs=False, record_videos=True)
+    def basic_evaluation_algorithm_wrapper_noFreshObs(self, n_episodes, difficulties, iteration, light_setting):
+        return self.basic_evaluation_algorithm_multi(n_episodes, difficulties, iteration, light_setting, use_fresh_obs=False, record_videos=True)
 
     def test_fresh_obs_improves(self, n_episodes: int = 10, difficulty: str = "easy", iteration: int = 0, light_setting: LightSetting = LightSetting.standard, log=False) -> float:
-        dirpath=f'{os.getcwd()}\\videos_iter_{iteration}'
+        dirpath = os.path.join(os.getcwd(), f'videos_iter_{iteration}')
         if not os.path.exists(dirpath):
             os.mkdir(dirpath)
 
@@ -714,12 +1019,14 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         difficulties = ["easy", "medium", "hard"]
 
-        for difficulty in difficulties:
-
-            fresh_obs_success_rate, fresh_obs_collision_rate = self.basic_evaluation_algorithm_wrapper_freshObs(n_episodes, difficulty, iteration, light_setting)
+        # all difficulties in one run each, this keeps all envs busy until the last episodes
+        fresh_obs_results = self.basic_evaluation_algorithm_wrapper_freshObs(n_episodes, difficulties, iteration, light_setting)
+        nonfresh_obs_results = self.basic_evaluation_algorithm_wrapper_noFreshObs(n_episodes, difficulties, iteration, light_setting)
 
+        for difficulty in difficulties:
 
-            nonfresh_obs_success_rate, nonfresh_obs_collision_rate = self.basic_evaluation_algorithm_wrapper_noFreshObs(n_episodes, difficulty, iteration, light_setting)
+            fresh_obs_success_rate, fresh_obs_collision_rate = fresh_obs_results[difficulty]
+            nonfresh_obs_success_rate, nonfresh_obs_collision_rate = nonfresh_obs_results[difficulty]
 
             print(f'difficulty: {difficulty}')
             print(f'fresh obs success rate: {fresh_obs_success_rate} collision rate: {fresh_obs_collision_rate}')
@@ -739,7 +1046,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
 
     def test_jetbot_generalization(self, n_episodes: int = 10, iteration: int = 0, light_setting: LightSetting = LightSetting.standard, log=False) -> float:
-        dirpath=f'{os.getcwd()}\\videos_iter_{iteration}'
+        dirpath = os.path.join(os.getcwd(), f'videos_iter_{iteration}')
         if not os.path.exists(dirpath):
             os.mkdir(dirpath)
 
@@ -757,8 +1064,9 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         jetBotNames= [name for name in jb_names if name != trainJetBotName]
 
         for jetBotName in jetBotNames:
+            results = self.basic_evaluation_algorithm_multi(n_episodes, difficulties, iteration, light_setting, jetbot_name = jetBotName, record_videos=True)
             for difficulty in difficulties:
-                jb_success_rate, jb_collision_rate = self.basic_evaluation_algorithm(n_episodes, difficulty, iteration, light_setting, jetbot_name = jetBotName, record_videos=True)
+                jb_success_rate, jb_collision_rate = results[difficulty]
 
                 print(f'{jetBotName} success rate: {jb_success_rate} collision rate: {jb_collision_rate} for difficulty {difficulty} Light Setting {light_setting}', flush=True)
                 if log:
@@ -769,12 +1077,12 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
     def eval_model(self: SelfOnPolicyAlgorithm, iteration: int = 0, n_eval_episodes: int = 20) -> float:
         print(f'eval started', flush=True)
-        eval_time = time.time()
+        eval_time = time.perf_counter()
 
         light_settings = [LightSetting.bright, LightSetting.standard, LightSetting.dark]
         
 
-        dirpath = f'{os.getcwd()}\\videos_iter_{iteration}'
+        dirpath = os.path.join(os.getcwd(), f'videos_iter_{iteration}')
         if not os.path.exists(dirpath):
             os.mkdir(dirpath)
 
@@ -788,25 +1096,30 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         for light_setting in light_settings:
             print(f'running eval for light setting {light_setting.name}', flush=True)
             
-            time_easy = time.time()
-            easy_success_rate, easy_collision_rate = self.basic_evaluation_algorithm(n_eval_episodes = n_eval_episodes, difficulty ="easy", iteration=iteration, light_setting=light_setting, log=True)
-            print(f'basic_evaluation_algorithm easy done in {(time.time() - time_easy)/60} minutes', flush=True)
-            medium_success_rate, medium_collision_rate = self.basic_evaluation_algorithm(n_eval_episodes =n_eval_episodes, difficulty="medium", iteration=iteration, light_setting=light_setting, log=True)
-            hard_success_rate, hard_collision_rate = self.basic_evaluation_algorithm(n_eval_episodes =n_eval_episodes, difficulty="hard", iteration=iteration, light_setting=light_setting, log=True)
+            time_light_setting = time.perf_counter()
+            # all difficulties in one run, this keeps all envs busy until the last episodes
+            results = self.basic_evaluation_algorithm_multi(n_eval_episodes = n_eval_episodes, difficulties=["easy", "medium", "hard"], iteration=iteration, light_setting=light_setting, log=True)
+            print(f'basic_evaluation_algorithm_multi done in {(time.perf_counter() - time_light_setting)/60} minutes', flush=True)
+            easy_success_rate, easy_collision_rate = results["easy"]
+            medium_success_rate, medium_collision_rate = results["medium"]
+            hard_success_rate, hard_collision_rate = results["hard"]
             total_success_rate += easy_success_rate + medium_success_rate + hard_success_rate
             light_success_rate = (easy_success_rate + medium_success_rate + hard_success_rate) / 3
             
-            self.my_record(f"eval/success_easy_{light_setting.name}", easy_success_rate)
-            self.my_record(f"eval/success_medium_{light_setting.name}", medium_success_rate)
-            self.my_record(f"eval/success_hard_{light_setting.name}", hard_success_rate)
-            self.my_record(f"eval/success_{light_setting.name}", light_success_rate)
-
             total_collision_rate += easy_collision_rate + medium_collision_rate + hard_collision_rate
             light_collision_rate = (easy_collision_rate + medium_collision_rate + hard_collision_rate) / 3
-            self.my_record(f"eval_collision_rates/collision_rate_easy_{light_setting.name}", easy_collision_rate)
-            self.my_record(f"eval_collision_rates/collision_rate_medium_{light_setting.name}", medium_collision_rate)
-            self.my_record(f"eval_collision_rates/collision_rate_hard_{light_setting.name}", hard_collision_rate)
-            self.my_record(f"eval_collision_rates/collision_rate_{light_setting.name}", light_collision_rate)
+
+            self.my_record_dict({
+                f"eval/success_easy_{light_setting.name}": easy_success_rate,
+                f"eval/success_medium_{light_setting.name}": medium_success_rate,
+                f"eval/success_hard_{light_setting.name}": hard_success_rate,
+                f"eval/success_{light_setting.name}": light_success_rate,
+
+                f"eval_collision_rates/collision_rate_easy_{light_setting.name}": easy_collision_rate,
+                f"eval_collision_rates/collision_rate_medium_{light_setting.name}": medium_collision_rate,
+                f"eval_collision_rates/collision_rate_hard_{light_setting.name}": hard_collision_rate,
+                f"eval_collision_rates/collision_rate_{light_setting.name}": light_collision_rate,
+            })
 
 
             avg_easy_success_rate += easy_success_rate
@@ -818,17 +1131,19 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             avg_hard_collision_rate += hard_collision_rate
 
         #if eval_light_settings:
-        self.my_record(f"eval/success_easy", avg_easy_success_rate / len(light_settings))
-        self.my_record(f"eval/success_medium", avg_medium_success_rate / len(light_settings))
-        self.my_record(f"eval/success_hard", avg_hard_success_rate / len(light_settings))
+        self.my_record_dict({
+            f"eval/success_easy": avg_easy_success_rate / len(light_settings),
+            f"eval/success_medium": avg_medium_success_rate / len(light_settings),
+            f"eval/success_hard": avg_hard_success_rate / len(light_settings),
 
-        self.my_record(f"eval_important/success_easy", avg_easy_success_rate / len(light_settings))
-        self.my_record(f"eval_important/success_medium", avg_medium_success_rate / len(light_settings))
-        self.my_record(f"eval_important/success_hard", avg_hard_success_rate / len(light_settings))
+            f"eval_important/success_easy": avg_easy_success_rate / len(light_settings),
+            f"eval_important/success_medium": avg_medium_success_rate / len(light_settings),
+            f"eval_important/success_hard": avg_hard_success_rate / len(light_settings),
 
-        self.my_record(f"eval_collision_rates/collision_rate_easy", avg_easy_collision_rate / len(light_settings))
-        self.my_record(f"eval_collision_rates/collision_rate_medium", avg_medium_collision_rate / len(light_settings))
-        self.my_record(f"eval_collision_rates/collision_rate_hard", avg_hard_collision_rate / len(light_settings))
+            f"eval_collision_rates/collision_rate_easy": avg_easy_collision_rate / len(light_settings),
+            f"eval_collision_rates/collision_rate_medium": avg_medium_collision_rate / len(light_settings),
+            f"eval_collision_rates/collision_rate_hard": avg_hard_collision_rate / len(light_settings),
+        })
 
         total_success_rate = total_success_rate / (3 * len(light_settings))
         if total_success_rate > self.max_total_success_rate:
@@ -840,13 +1155,15 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         
 
 
-        self.my_record("eval/total_success_rate", total_success_rate)
-        self.my_record("eval_important/total_success_rate", total_success_rate)
+        self.my_record_dict({
+            "eval/total_success_rate": total_success_rate,
+            "eval_important/total_success_rate": total_success_rate,
 
-        self.my_record("eval/collision_rate", total_collision_rate)
-        self.my_record("eval_collision_rates/collision_rate", total_collision_rate)
+            "eval/collision_rate": total_collision_rate,
+            "eval_collision_rates/collision_rate": total_collision_rate,
+        })
 
-        print(f'basic eval (question 1 and 2) finished in {(time.time() - eval_time)/60} minutes', flush=True)
+        print(f'basic eval (question 1 and 2) finished in {(time.perf_counter() - eval_time)/60} minutes', flush=True)
 
         return total_success_rate
     
@@ -857,6 +1174,15 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             indices=[0]
         )[0]
 
+        # the schedule only depends on these values, it is the same for every light setting and evaluation
+        cache_key = (difficulty, n_eval_episodes, rotationMode)
+        if cache_key not in self._map_and_rotations_cache:
+            self._map_and_rotations_cache[cache_key] = self.build_map_and_rotations(difficulty, n_eval_episodes, rotationMode)
+        # a new list, the callers may modify it
+        return list(self._map_and_rotations_cache[cache_key])
+
+    def build_map_and_rotations(self, difficulty: str, n_eval_episodes: int, rotationMode: SpawnOrientation) -> List[Tuple[MapType, float]]:
+
         rotation_range_min, rotation_range_max = SpawnOrientation.getOrientationRange(rotationMode)
 
         range_width = rotation_range_max - rotation_range_min
@@ -864,17 +1190,14 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         if n_eval_episodes == 1:
             rotations = [float(rotation_range_min + range_width / 2)]
         else:
-            step = range_width / (n_eval_episodes-1)
-
-            rotations = [rotation_range_min + i * step for i in range(n_eval_episodes)]
-            rotations = [float(rotation) for rotation in rotations]
+            # equally spaced over the whole range, including both ends
+            rotations = np.linspace(rotation_range_min, rotation_range_max, n_eval_episodes).tolist()
 
         track_numbers = MapType.getAllTracknumbersOfDifficulty(difficulty)
 
-        tracks = []
-        for i in range(n_eval_episodes):
-            track = track_numbers[i % len(track_numbers)]
-            tracks.append(MapType(track))
+        # the tracks of the difficulty are used in turns
+        track_indices = np.arange(n_eval_episodes) % len(track_numbers)
+        tracks = [MapType(track_numbers[j]) for j in track_indices]
 
         # and example of the resulting track and rotation combinations:
         # map_and_rotations: [(<MapType.hardBlueFirstLeft: 7>, -15), (<MapType.hardBlueFirstRight: 8>, -13), (<MapType.hardRedFirstLeft: 9>, -11), (<MapType.hardRedFirstRight: 10>, -10), (<MapType.hardBlueFirstLeft: 7>, -8), (<MapType.hardBlueFirstRight: 8>, -7), (<MapType.hardRedFirstLeft: 9>, -5), (<MapType.hardRedFirstRight: 10>, -3), (<MapType.hardBlueFirstLeft: 7>, -2), (<MapType.hardBlueFirstRight: 8>, 0), (<MapType.hardRedFirstLeft: 9>, 0), (<MapType.hardRedFirstRight: 10>, 2), (<MapType.hardBlueFirstLeft: 7>, 3), (<MapType.hardBlueFirstRight: 8>, 5), (<MapType.hardRedFirstLeft: 9>, 7), (<MapType.hardRedFirstRight: 10>, 8), (<MapType.hardBlueFirstLeft: 7>, 10), (<MapType.hardBlueFirstRight: 8>, 11), (<MapType.hardRedFirstLeft: 9>, 13), (<MapType.hardRedFirstRight: 10>, 15)]
@@ -895,6 +1218,29 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         log: bool = False,
         jetbot_name: str = "DifferentialJetBot",
         record_videos: bool = False
+    ):
+        results = self.basic_evaluation_algorithm_multi(n_eval_episodes=n_eval_episodes, difficulties=[difficulty], iteration=iteration, light_setting=light_setting, use_fresh_obs=use_fresh_obs, deterministic=deterministic, log=log, jetbot_name=jetbot_name, record_videos=record_videos)
+        return results[difficulty]
+
+    def eval_results_cache_key(self, difficulty, n_eval_episodes, iteration, light_setting, use_fresh_obs, deterministic, log, jetbot_name, record_videos):
+        # key of _eval_results_cache, None if the run must neither use nor fill the cache
+        # runs that log or record videos have to run to produce their artifacts (tensorboard, videos, endInfo.yml)
+        # non deterministic runs draw a new sample every time
+        if log or record_videos or not deterministic:
+            return None
+        return (n_eval_episodes, difficulty, iteration, light_setting.name, use_fresh_obs, jetbot_name, self.num_timesteps)
+
+    def basic_evaluation_algorithm_multi(
+        self: SelfOnPolicyAlgorithm,
+        n_eval_episodes: int = 10,
+        difficulties: List[str] = ["easy"],
+        iteration: int = 0,
+        light_setting: LightSetting = LightSetting.standard,
+        use_fresh_obs: bool = False,
+        deterministic: bool = False,
+        log: bool = False,
+        jetbot_name: str = "DifferentialJetBot",
+        record_videos: bool = False
     ):
         # all maps from the difficulty setting are selected with the same proportion
         # the JetBot spawn rotation depends on the spawn_pos in the config, e.g. OrientationRandom
@@ -902,26 +1248,48 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         # this results in identical spawn positions/rotations and maps for a particular set of function parameters
 
-        map_and_rotations = self.generate_map_and_rotations(difficulty, n_eval_episodes, self.env)
+        # the episodes of all difficulties are run in a single loop, the envs do not have to wait for the last episodes of a difficulty
+        # n_eval_episodes episodes are run per difficulty, returns a dictionary difficulty -> (success_rate, collision_rate)
+
+        # the same model is often evaluated with the same settings multiple times in one evaluation round (e.g. eval_model and test_deterministic_improves)
+        # deterministic runs without logging and videos reuse the results of an earlier such run with identical settings
+        def cache_key(difficulty):
+            return self.eval_results_cache_key(difficulty, n_eval_episodes, iteration, light_setting, use_fresh_obs, deterministic, log, jetbot_name, record_videos)
+
+        cached_results = {}
+        if cache_key(difficulties[0]) is not None:
+            cached_results = {difficulty: self._eval_results_cache[cache_key(difficulty)] for difficulty in difficulties if cache_key(difficulty) in self._eval_results_cache}
+        difficulties = [difficulty for difficulty in difficulties if difficulty not in cached_results]
+        if len(difficulties) == 0:
+            return cached_results
+
+        map_and_rotations = [(difficulty, mapType, spawnRot) for difficulty in difficulties for mapType, spawnRot in self.generate_map_and_rotations(difficulty, n_eval_episodes, self.env)]
         map_and_rotations_counter = 0
         #print(f'map_and_rotations: {map_and_rotations}', flush=True)
+        n_total_episodes = len(map_and_rotations)
 
         env = self.env
         n_envs = env.num_envs
-        episode_rewards = []
-        episode_lengths = []
+        # preallocated, finished_per_difficulty is the index of the next finished episode of each difficulty
+        episode_rewards = {difficulty: np.empty(n_eval_episodes, dtype=np.float32) for difficulty in difficulties}
+        episode_lengths = {difficulty: np.empty(n_eval_episodes, dtype=np.int32) for difficulty in difficulties}
+        finished_per_difficulty = {difficulty: 0 for difficulty in difficulties}
         finished_episodes = 0
         
-        episodes_results = EpisodesResults()
+        episodes_results = {difficulty: EpisodesResults() for difficulty in difficulties}
+        # infos of the finished episodes, processed in one batch after the loop
+        finished_infos = {difficulty: [] for difficulty in difficulties}
+
+        # difficulty of the running episode of each env, set at the reset
+        current_difficulty = [None for _ in range(n_envs)]
 
 
         episode_counts = np.zeros(n_envs, dtype="int")
         # Divides episodes among different sub environments in the vector as evenly as possible
-        episode_count_targets = np.array([(n_eval_episodes + i) // n_envs for i in range(n_envs)], dtype="int")
+        episode_count_targets = np.array([(n_total_episodes + i) // n_envs for i in range(n_envs)], dtype="int")
         # episode_count_targets represents the amount of episodes that have to be played in the corresponding env
-        # the sum of these values is equal to n_eval_episodes
+        # the sum of these values is equal to n_total_episodes
 
-        current_rewards = np.zeros(n_envs)
         current_lengths = np.zeros(n_envs, dtype="int")
 
         if log or record_videos:
@@ -929,31 +1297,53 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             log_indices = [0] # these indices will record videos
         else:
             log_indices = []
-        for i in log_indices:
-            if use_fresh_obs:
-                prefix = "freshObs_"
-            else:
-                prefix = ""
-
-            env.env_method(
-                method_name="setVideoFilename",
-                indices=[i],
-                video_filename = f'{os.getcwd()}\\videos_iter_{iteration}\\{prefix}{difficulty}_{light_setting.name}_{jetbot_name}_env_{i}_video_'
-            )
+        if use_fresh_obs:
+            prefix = "freshObs_"
+        else:
+            prefix = ""
+        # the path does not change during the evaluation
+        video_dir = os.path.join(os.getcwd(), f'videos_iter_{iteration}')
+
+        # number of logged episodes for each env and difficulty, used for the names of the endInfo files
+        logged_episode_counts = {(i, difficulty): 0 for i in log_indices for difficulty in difficulties}
+
+        # video filenames that were last set for the log indices (None: unknown), consecutive episodes of the same difficulty use the same one
+        video_filenames = {i: None for i in log_indices}
+
+        def set_video_filename(i, video_filename):
+            # only calls into the env if the filename changes
+            if video_filenames[i] != video_filename:
+                env.env_method(
+                    method_name="setVideoFilename",
+                    indices=[i],
+                    video_filename = video_filename
+                )
+                video_filenames[i] = video_filename
         
 
-        amount_of_envs_first_run = min(n_envs, n_eval_episodes)
-        for i in range(amount_of_envs_first_run):
-            env.env_method(
-                method_name="reset",
-                indices=[i],
-                mapType=map_and_rotations[map_and_rotations_counter][0],
+        def next_reset_kwargs(i):
+            # reset arguments for the next map and rotation, env i will run this episode
+            nonlocal map_and_rotations_counter
+            difficulty, mapType, spawnRot = map_and_rotations[map_and_rotations_counter]
+            current_difficulty[i] = difficulty
+
+            if i in log_indices:
+                # the video filename is passed to unity at the reset, it contains the difficulty of the episode
+                set_video_filename(i, os.path.join(video_dir, f'{prefix}{difficulty}_{light_setting.name}_{jetbot_name}_env_{i}_video_'))
+
+            kwargs = dict(
+                mapType=mapType,
                 lightSetting=light_setting,
                 evalMode=True,
-                spawnRot = map_and_rotations[map_and_rotations_counter][1],
+                spawnRot = spawnRot,
                 jetBotName = jetbot_name
             )
             map_and_rotations_counter += 1
+            return kwargs
+
+        amount_of_envs_first_run = min(n_envs, n_total_episodes)
+        first_run_indices = list(range(amount_of_envs_first_run))
+        self.reset_envs(env, first_run_indices, [next_reset_kwargs(i) for i in first_run_indices])
 
 
         # switch to eval mode
@@ -971,103 +1361,112 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
     
             
             actions, values, log_probs, obs = self.inferFromObservations(env, deterministic, use_fresh_obs)
-            actions = actions.cpu().numpy()
 
             # Rescale and perform action
-            clipped_actions = actions
             # Clip the actions to avoid out of bound error
-            if isinstance(self.action_space, spaces.Box):
-                clipped_actions = np.clip(
-                    actions, self.action_space.low, self.action_space.high)
+            # the unclipped actions are not needed during evaluation, so we clip on the device before the copy
+            # in place, instead of allocating a new tensor every step (actions is an inference tensor, it can only be modified in inference mode)
+            if self._action_space_is_box:
+                with th.inference_mode():
+                    actions.clamp_(self._action_low_t, self._action_high_t)
+            clipped_actions = self.actions_to_numpy(actions)
             
-            observations, _, dones, infos = step_wrapper(env, clipped_actions, self.use_bundled_calls)
+            # envs that finished all their episodes are not stepped anymore (bundled calls only)
+            # episode_counts only changes after the step, the mask is valid for the whole step
+            active = episode_counts < episode_count_targets
+            observations, _, dones, infos = step_wrapper(env, clipped_actions, self.use_bundled_calls, active_indices=np.flatnonzero(active), out=self.next_step_obs_buffer())
             
+            # the resets of this step are done together after all envs are processed
+            reset_indices, reset_kwargs = [], []
+
             current_lengths += 1
-            for i in range(n_envs):
+            # only the envs that finished an episode they still had to play need to be processed
+            done_indices = np.flatnonzero(dones & active)
+            # the counters of all finished envs at once, every index appears once in done_indices
+            episode_counts[done_indices] += 1
+            finished_episodes += len(done_indices)
+            for i in done_indices:
+                difficulty = current_difficulty[i]
+
+                episode_rewards[difficulty][finished_per_difficulty[difficulty]] = float(infos[i]["cumreward"])
+                episode_lengths[difficulty][finished_per_difficulty[difficulty]] = current_lengths[i]
+                finished_per_difficulty[difficulty] += 1
+
+                finished_infos[difficulty].append(infos[i])
+
+                if i in log_indices:
+                    logged_episode_counts[(i, difficulty)] += 1
+                    with open(os.path.join(video_dir, f'{prefix}{difficulty}_{light_setting.name}_{jetbot_name}_env_{i}_episode_{logged_episode_counts[(i, difficulty)]-1}_endInfo.yml'), 'w') as outfile:
+                        yaml.dump(infos[i], outfile, default_flow_style=False)
+
+
+                    if episode_counts[i] == episode_count_targets[i]:
+                        # no more logging needed for this env
+                        set_video_filename(i, "")
+
+                # reset if we still need more runs for that environment
                 if episode_counts[i] < episode_count_targets[i]:
+                    reset_indices.append(i)
+                    reset_kwargs.append(next_reset_kwargs(i))
+
+            current_lengths[done_indices] = 0
 
-                    if dones[i]:
-                        
-                        episode_rewards.append(float(infos[i]["cumreward"].replace(",",".")))
-                        episode_lengths.append(current_lengths[i])
-                        episode_counts[i] += 1
-                        current_rewards[i] = 0
-                        current_lengths[i] = 0
-                        finished_episodes += 1
-
-                        episodes_results.processInfoDictEpisodeFinished(infos[i])
-
-                        if i in log_indices:
-                            if episode_counts[i] <= episode_count_targets[i]:
-                                with open(os.path.join(f'{os.getcwd()}\\videos_iter_{iteration}\\{prefix}{difficulty}_{light_setting.name}_{jetbot_name}_env_{i}_episode_{episode_counts[i]-1}_endInfo.yml'), 'w') as outfile:
-                                    yaml.dump(infos[0], outfile, default_flow_style=False)
-
-
-                            if episode_counts[i] == episode_count_targets[i]:
-                                # no more logging needed for this env
-                                env.env_method(
-                                    method_name="setVideoFilename",
-                                    indices=[i],
-                                    video_filename = ""
-                                )
-
-                        # reset if we still need more runs for that environment
-                        if episode_counts[i] < episode_count_targets[i]:
-                            env.env_method(
-                                method_name="reset",
-                                indices=[i],
-                                mapType=map_and_rotations[map_and_rotations_counter][0],
-                                lightSetting=light_setting,
-                                evalMode=True,
-                                spawnRot = map_and_rotations[map_and_rotations_counter][1],
-                                jetBotName = jetbot_name
-                            )
-                            map_and_rotations_counter += 1
+            self.reset_envs(env, reset_indices, reset_kwargs)
             
-            self._last_obs = observations
+            # with fresh obs inferFromObservations does not read _last_obs
+            if not use_fresh_obs:
+                self._last_obs = observations
 
-        assert np.sum(episode_counts) == n_eval_episodes, f"not all episodes were finished, {np.sum(episode_counts)} != {n_eval_episodes}"
-        assert finished_episodes == n_eval_episodes, f"not all episodes were finished, {finished_episodes} != {n_eval_episodes}"
-        assert map_and_rotations_counter == n_eval_episodes, f"not all maps were used, {map_and_rotations_counter} != {len(map_and_rotations)}"
+        assert np.sum(episode_counts) == n_total_episodes, f"not all episodes were finished, {np.sum(episode_counts)} != {n_total_episodes}"
+        assert finished_episodes == n_total_episodes, f"not all episodes were finished, {finished_episodes} != {n_total_episodes}"
+        assert map_and_rotations_counter == n_total_episodes, f"not all maps were used, {map_and_rotations_counter} != {len(map_and_rotations)}"
 
-        mean_reward = np.mean(episode_rewards)
-        std_reward = np.std(episode_rewards)
-        
-        episodes_results.computeRates()
+        results = {}
+        for difficulty in difficulties:
+            assert finished_per_difficulty[difficulty] == n_eval_episodes, f"wrong number of {difficulty} episodes, {finished_per_difficulty[difficulty]} != {n_eval_episodes}"
 
-        if log: 
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/mean_reward', mean_reward)
+            difficulty_results = episodes_results[difficulty]
+            difficulty_results.processInfoDictsEpisodesFinished(finished_infos[difficulty])
+            mean_reward = np.mean(episode_rewards[difficulty])
+            std_reward = np.std(episode_rewards[difficulty])
             
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/std_reward', std_reward)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/success_rate', episodes_results.success_rate)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_passed_goals', episodes_results.goal_completion_rate)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_timeouts', episodes_results.timeout_rate)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_episode_with_collision', episodes_results.collision_episodes / n_eval_episodes)
+            difficulty_results.computeRates()
+
+            if log: 
+                tag = f'eval_{difficulty}_{light_setting.name}'
+                self.my_record_dict({
+                    f'{tag}/mean_reward': mean_reward,
+                    f'{tag}/std_reward': std_reward,
+                    f'{tag}/success_rate': difficulty_results.success_rate,
+                    f'{tag}/rate_passed_goals': difficulty_results.goal_completion_rate,
+                    f'{tag}/rate_timeouts': difficulty_results.timeout_rate,
+                    f'{tag}/rate_episode_with_collision': difficulty_results.collision_episodes / n_eval_episodes,
+
+                    f'{tag}/rate_first_goal': difficulty_results.first_goal_completion_rate,
+                    f'{tag}/rate_second_goal': difficulty_results.second_goal_completion_rate,
+                    f'{tag}/rate_third_goal': difficulty_results.third_goal_completion_rate,
 
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_first_goal', episodes_results.first_goal_completion_rate)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_second_goal', episodes_results.second_goal_completion_rate)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_third_goal', episodes_results.third_goal_completion_rate)
+                    f"{tag}/step_average_wait_time": difficulty_results.waitTime / np.sum(episode_lengths[difficulty]),
+                    f'{tag}/average_episode_length': np.average(episode_lengths[difficulty]),
 
-            step_average_wait_time = episodes_results.waitTime / np.sum(episode_lengths)
-            self.my_record(f"eval_{difficulty}_{light_setting.name}/step_average_wait_time", step_average_wait_time)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/average_episode_length', np.average(episode_lengths))
+                    f'{tag}/collision_rate_succesful_episodes': difficulty_results.collision_rate_succesful_episodes,
+                    f'{tag}/goal_completion_rate': difficulty_results.goal_completion_rate,
+                    f'{tag}/rate_timeouts_all_goals_succesful': difficulty_results.rate_timeout_all_goals_successful,
 
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/collision_rate_succesful_episodes', episodes_results.collision_rate_succesful_episodes)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/goal_completion_rate', episodes_results.goal_completion_rate)
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_timeouts_all_goals_succesful', episodes_results.rate_timeout_all_goals_successful)
+                    f'{tag}/rate_finishLineHit': difficulty_results.rate_finishLineHit,
+                })
 
-            self.my_record(f'eval_{difficulty}_{light_setting.name}/rate_finishLineHit', episodes_results.rate_finishLineHit)
+            results[difficulty] = (difficulty_results.success_rate, difficulty_results.collision_rate)
+            if cache_key(difficulty) is not None:
+                self._eval_results_cache[cache_key(difficulty)] = results[difficulty]
 
 
         # set to no video afterwards
         for index in log_indices:
-            env.env_method(
-                method_name="setVideoFilename",
-                indices=[index],
-                video_filename = ""
-            )
+            set_video_filename(index, "")
 
-        return episodes_results.success_rate, episodes_results.collision_rate
+        results.update(cached_results)
+        return results
     
 
     def eval_only(
@@ -1096,7 +1495,10 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             step = offset + i*1000
             self.num_timesteps = step # for proper logging we need to manipulate this, very dirty!!!
 
-            eval_time = time.time()
+            # results of earlier iterations are not reused
+            self._eval_results_cache.clear()
+
+            eval_time = time.perf_counter()
 
             self.eval_model(iteration=step, n_eval_episodes=n_eval_episodes)
             self.my_dump(step=step)
@@ -1110,7 +1512,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             self.test_episodes_identical_start_conditions(n_episodes=n_eval_episodes, iteration=step, light_setting=LightSetting.standard, spawnRot=15.0, log=True)
             self.test_fresh_obs_improves(n_episodes=n_eval_episodes, iteration=step, light_setting=LightSetting.standard, deterministic=True, spawnRot=15.0, log=True)
 
-            eval_time = time.time() - eval_time
+            eval_time = time.perf_counter() - eval_time
             self.my_record("time/eval_time_seconds", eval_time)
 
             print(f'eval finished minutes: {eval_time / 60}')
@@ -1120,6 +1522,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
             print(f'total_eval_time: {total_eval_time}', flush=True)
 
+        self.close_metric_writers()
         return self
     
     def invariant_output_test(self):
@@ -1127,7 +1530,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         env.reset()
 
 
-        with th.no_grad():
+        with th.inference_mode():
             obs = get_obs_bundled_calls(env)
         
             obs_tensor = obs_as_tensor(obs, self.device)
@@ -1159,13 +1562,14 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         env = self.env
         n_envs = env.num_envs
-        episode_rewards = []
-        episode_lengths = []
+        # preallocated, finished_episodes is the index of the next finished episode
+        episode_rewards = np.empty(n_episodes, dtype=np.float32)
+        episode_lengths = np.empty(n_episodes, dtype=np.int32)
         success_count, finished_episodes = 0, 0
        
         # episode results are characterized by endEvent, collision, passedFirstGoal, passedSecondGoal, passedThirdGoal
 
-        episode_results = []
+        episode_results: List[Optional[EpisodeRepresentation]] = [None] * n_episodes
 
 
         episode_counts = np.zeros(n_envs, dtype="int")
@@ -1174,21 +1578,17 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         # episode_count_targets represents the amount of episodes that have to be played in the corresponding env
         # the sum of these values is equal to n_eval_episodes
 
-        current_rewards = np.zeros(n_envs)
         current_lengths = np.zeros(n_envs, dtype="int")
 
-        dirpath = f'{os.getcwd()}\\videos_identicalStartConditions_iter_{iteration}'
+        dirpath = os.path.join(os.getcwd(), f'videos_identicalStartConditions_iter_{iteration}')
         if not os.path.exists(dirpath):
             os.mkdir(dirpath)
+        # the file names only differ in the env index and the episode number
+        file_prefix = f'{light_setting.name}_{int(spawnRot)}_deter{deterministic}'
 
         # reset environment 0 to record the videos
         log_indices = [0, 1] # these indices will record videos
-        for i in log_indices:
-            env.env_method(
-                method_name="setVideoFilename",
-                indices=[i],
-                video_filename = f'{os.getcwd()}\\videos_identicalStartConditions_iter_{iteration}\\{light_setting.name}_{int(spawnRot)}_deter{deterministic}_env_{i}_video_'
-            )
+        set_video_filenames(env, log_indices, [os.path.join(dirpath, f'{file_prefix}_env_{i}_video_') for i in log_indices])
 
         if difficulty == "easy":
             map = MapType.easyBlueFirst
@@ -1198,15 +1598,11 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             map = MapType.hardBlueFirstRight
 
 
+        # all envs are reset with one specific map and rotation (same as reset_with_mapType_spawnrotation)
+        identical_reset_kwargs = dict(mapType=map, lightSetting=light_setting, evalMode=True, spawnRot=spawnRot)
+
         # reset all envs with one specific map and rotation
-        env.env_method(
-            method_name="reset_with_mapType_spawnrotation",
-            indices=range(n_envs),
-            mapType=map,
-            lightSetting=light_setting,
-            evalMode=True,
-            spawnRot=spawnRot
-        ) 
+        self.reset_envs(env, list(range(n_envs)), [identical_reset_kwargs for _ in range(n_envs)])
 
         # switch to eval mode
         self.policy.set_training_mode(False)
@@ -1223,62 +1619,66 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         while (episode_counts < episode_count_targets).any():
     
             actions, values, log_probs, obs = self.inferFromObservations(env, deterministic=deterministic, use_fresh_obs=self.use_fresh_obs)
-            actions = actions.cpu().numpy()
 
             # Rescale and perform action
-            clipped_actions = actions
             # Clip the actions to avoid out of bound error
-            if isinstance(self.action_space, spaces.Box):
-                clipped_actions = np.clip(
-                    actions, self.action_space.low, self.action_space.high)
+            # the unclipped actions are not needed during evaluation, so we clip on the device before the copy
+            # in place, instead of allocating a new tensor every step (actions is an inference tensor, it can only be modified in inference mode)
+            if self._action_space_is_box:
+                with th.inference_mode():
+                    actions.clamp_(self._action_low_t, self._action_high_t)
+            clipped_actions = self.actions_to_numpy(actions)
             
-            observations, _, dones, infos = step_wrapper(env, clipped_actions, self.use_bundled_calls)
+            # envs that finished all their episodes are not stepped anymore (bundled calls only)
+            # episode_counts only changes after the step, the mask is valid for the whole step
+            active = episode_counts < episode_count_targets
+            observations, _, dones, infos = step_wrapper(env, clipped_actions, self.use_bundled_calls, active_indices=np.flatnonzero(active), out=self.next_step_obs_buffer())
             
-            current_lengths += 1
-            for i in range(n_envs):
-                if episode_counts[i] < episode_count_targets[i]:
+            # the resets of this step are done together after all envs are processed
+            reset_indices, reset_kwargs = [], []
 
-                    if dones[i]:
+            current_lengths += 1
+            # only the envs that finished an episode they still had to play need to be processed
+            done_indices = np.flatnonzero(dones & active)
+            # the episodes of this step are stored in the order of done_indices, starting at finished_episodes
+            finished_slice = slice(finished_episodes, finished_episodes + len(done_indices))
+            episode_lengths[finished_slice] = current_lengths[done_indices]
+            episode_counts[done_indices] += 1
+            for i in done_indices:
+                episode_rewards[finished_episodes] = float(infos[i]["cumreward"])
+                episode_results[finished_episodes] = EpisodeRepresentation.from_info(infos[i])
+                finished_episodes += 1
 
-                        episode_rewards.append(float(infos[i]["cumreward"].replace(",",".")))
-                        episode_lengths.append(current_lengths[i])
-                        episode_counts[i] += 1
-                        current_rewards[i] = 0
-                        current_lengths[i] = 0
-                        finished_episodes += 1
 
+                if infos[i]["endEvent"] == "Success":
+                    success_count += 1
 
-                        if infos[i]["endEvent"] == "Success":
-                            success_count += 1
+                if i in log_indices:
 
-                        episode_results.append(EpisodeRepresentation(infos[i]))
+                    if episode_counts[i] <= episode_count_targets[i]:
+                        with open(os.path.join(dirpath, f'{file_prefix}_env_{i}_episode_{episode_counts[i]-1}_endInfo.yml'), 'w') as outfile:
+                            yaml.dump(infos[i], outfile, default_flow_style=False)
 
-                        if i in log_indices:
+                    if episode_counts[i] == episode_count_targets[i]-1:
+                        # no more logging needed for this env
+                        env.env_method(
+                            method_name="setVideoFilename",
+                            indices=[i],
+                            video_filename = ""
+                        )
 
-                            if episode_counts[i] <= episode_count_targets[i]:
-                                with open(os.path.join(f'{os.getcwd()}\\videos_identicalStartConditions_iter_{iteration}\\{light_setting.name}_{int(spawnRot)}_deter{deterministic}_env_{i}_episode_{episode_counts[i]-1}_endInfo.yml'), 'w') as outfile:
-                                    yaml.dump(infos[i], outfile, default_flow_style=False)
 
-                            if episode_counts[i] == episode_count_targets[i]-1:
-                                # no more logging needed for this env
-                                env.env_method(
-                                    method_name="setVideoFilename",
-                                    indices=[i],
-                                    video_filename = ""
-                                )
+                # due to auto reset we have to reset the env again with the right parameters:
+                reset_indices.append(i)
+                reset_kwargs.append(identical_reset_kwargs)
 
+            current_lengths[done_indices] = 0
 
-                        # due to auto reset we have to reset the env again with the right parameters:
-                        env.env_method(
-                            method_name="reset_with_mapType_spawnrotation",
-                            indices=[i],
-                            mapType=map,
-                            lightSetting=light_setting,
-                            evalMode=True,
-                            spawnRot=spawnRot
-                        )
+            self.reset_envs(env, reset_indices, reset_kwargs)
             
-            self._last_obs = observations
+            # with fresh obs inferFromObservations does not read _last_obs
+            if not self.use_fresh_obs:
+                self._last_obs = observations
 
         assert np.sum(episode_counts) == n_episodes, f"not all episodes were finished, {np.sum(episode_counts)} != {n_episodes}"
         assert finished_episodes == n_episodes, f"not all episodes were finished, {finished_episodes} != {n_episodes}"
@@ -1288,24 +1688,24 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         episode_results_counter = collections.Counter(episode_results)
 
-        most_common_episode_result = max(set(episode_results), key=episode_results.count)
+        # the counter already contains the counts, no need to count every result again with list.count
+        most_common_episode_result, most_common_count = episode_results_counter.most_common(1)[0]
 
         print(f'results for spawnRot={spawnRot} and map={map} and lightSetting={light_setting.name} deterministic={deterministic}')
         print(f'most common episode result: {most_common_episode_result}')
 
         print(f'episode results and counts: {episode_results_counter}')
 
-        most_common_episode_result_rate = episode_results_counter[most_common_episode_result] / n_episodes
+        most_common_episode_result_rate = most_common_count / n_episodes
         print(f'deterministic={deterministic} rate of most common episode result: {most_common_episode_result_rate}')
         
         
-        # set to no video afterwards
-        for index in log_indices:
-            env.env_method(
-                method_name="setVideoFilename",
-                indices=[index],
-                video_filename = ""
-            )
+        # set to no video afterwards, the same argument for all log indices
+        env.env_method(
+            method_name="setVideoFilename",
+            indices=log_indices,
+            video_filename = ""
+        )
 
         if log:
             self.my_record(f'identicalStartConditions/most_common_rate_rot{int(spawnRot)}_deter{deterministic}', most_common_episode_result_rate)
@@ -1319,12 +1719,13 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             print(f'WARNING, non deterministic sampling can only be reproduced when a single env is used for the recording (and replay)', flush=True)
 
         print(f'episode recording started', flush=True)
-        record_startTime = time.time()
+        record_startTime = time.perf_counter()
 
         episode_recordings_path = os.path.join(os.getcwd(),"episode_recordings")
         os.mkdir(episode_recordings_path)
         self.save(os.path.join(episode_recordings_path,"model"))
         np.save(os.path.join(episode_recordings_path,"n_envs.npy"), self.env.num_envs)
+        np.save(os.path.join(episode_recordings_path,"format_version.npy"), RECORDING_FORMAT_VERSION)
         np.save(os.path.join(episode_recordings_path, "n_episodes.npy"), episode_record_settings.n_episodes_per_setting)
         with open(os.path.join(episode_recordings_path, "record_config.yaml"), 'w') as f:
             OmegaConf.save(episode_record_settings, f)
@@ -1355,7 +1756,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
                  
         
         print(f'recorded episodes:\ntotal_number_episodes: {total_number_episodes} succesful_episodes: {succesful_episodes}', flush=True)
-        print(f'recording took {(time.time() - record_startTime)/60} minutes', flush=True)
+        print(f'recording took {(time.perf_counter() - record_startTime)/60} minutes', flush=True)
 
     def record_episode(self, light_setting, episode_path, map_and_rotation, deterministic):
         env = self.env
@@ -1366,7 +1767,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         env.env_method(
             method_name="setVideoFilename",
             indices=[0],
-            video_filename = f'{episode_path}\\video_'
+            video_filename = os.path.join(episode_path, 'video_')
         )
 
         # reset to initialize all envs (required for bundled calls)
@@ -1409,9 +1810,10 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             # Rescale and perform action
             clipped_actions = actions
             # Clip the actions to avoid out of bound error
-            if isinstance(self.action_space, spaces.Box):
+            # the unclipped actions are recorded, so we clip on the host into the preallocated buffer
+            if self._action_space_is_box:
                 clipped_actions = np.clip(
-                    actions, self.action_space.low, self.action_space.high)
+                    actions, self._action_low, self._action_high, out=self._clipped_actions)
             
             observations, _, dones, infos, stepReturnObjects = step_wrapper(env, clipped_actions, self.use_bundled_calls, return_step_return_objects=True)
             
@@ -1424,7 +1826,7 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
             if dones[0]:
                 done = True
-                episode_repr = EpisodeRepresentation(infos[0])
+                episode_repr = EpisodeRepresentation.from_info(infos[0])
 
                 with open(os.path.join(episode_path,'endInfo.yml'), 'w') as outfile:
                     yaml.dump(infos[0], outfile, default_flow_style=False)
@@ -1435,42 +1837,31 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
                     success=True
             
 
-        def saveImg(string, filename):
-            im = env.env_method(
-                method_name="stringToImg",
-                indices=[0],
-                string=string
-            )[0]
-            pixels_rgb = np.array(im, dtype=np.uint8)
-            env.env_method(
-                method_name="saveImage",
-                indices=[0],
-                array = pixels_rgb,
-                filename = filename
-            )
-
-
-        os.mkdir(os.path.join(episode_path,"step_images"))
-        os.mkdir(os.path.join(episode_path,"infer_images"))
-
-        for i in range(len(step_obstrings)):
-            saveImg(step_obstrings[i], os.path.join(episode_path, "step_images", f'step_image_{i}.png'))
-            # images from step are also needed to reproduce the observations (since there is a memory_rolloer in processStepReturnObject)
-            
-        for i in range(len(infer_obsstrings)):
-            saveImg(infer_obsstrings[i], os.path.join(episode_path, "infer_images", f'infer_image_{i}.png'))
-
+        def stringToPixels(string):
+            im = env.envs[0].stringToImg(string)
+            return np.array(im, dtype=np.uint8)
+
+        def saveFrames(strings, filename):
+            # all frames of the episode in one .npy file instead of one png per frame
+            # written through a memmap, the frames are decoded one after another and never held in memory together
+            first_frame = stringToPixels(strings[0])
+            frames = np.lib.format.open_memmap(filename, mode='w+', dtype=np.uint8, shape=(len(strings), *first_frame.shape))
+            frames[0] = first_frame
+            for i in range(1, len(strings)):
+                frames[i] = stringToPixels(strings[i])
+            frames.flush()
+            del frames
+
+        saveFrames(step_obstrings, os.path.join(episode_path, 'step_frames.npy'))
+        # images from step are also needed to reproduce the observations (since there is a memory_rolloer in processStepReturnObject)
+        saveFrames(infer_obsstrings, os.path.join(episode_path, 'infer_frames.npy'))
+
+        # one device to host copy each instead of one per step
         sampled_actions = np.array(sampled_actions)
-        for i in range(len(obtained_values)):
-            obtained_values[i] = obtained_values[i].cpu().numpy()
-        obtained_values = np.array(obtained_values)
-        for i in range(len(obtained_values)):
-            obtained_log_probs[i] = obtained_log_probs[i].cpu().numpy()
-        obtained_log_probs = np.array(obtained_log_probs)
+        obtained_values = th.stack(obtained_values).cpu().numpy()
+        obtained_log_probs = th.stack(obtained_log_probs).cpu().numpy()
 
-        np.save(os.path.join(episode_path,f'sampled_actions.npy'), sampled_actions)
-        np.save(os.path.join(episode_path, f'obtained_values.npy'), obtained_values)
-        np.save(os.path.join(episode_path, f'obtained_log_probs.npy'), obtained_log_probs)
+        np.savez(os.path.join(episode_path, 'tensors.npz'), sampled_actions=sampled_actions, obtained_values=obtained_values, obtained_log_probs=obtained_log_probs)
 
         # save episode length
         np.save(os.path.join(episode_path,'episode_length.npy'), len(infer_obsstrings))
@@ -1512,14 +1903,44 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
         
     
         n_episodes_recording = np.load(os.path.join(base_path,'n_episodes.npy'))
+
+        if os.path.exists(os.path.join(base_path,'format_version.npy')):
+            format_version = int(np.load(os.path.join(base_path,'format_version.npy')))
+        else:
+            # recorded before the format version was saved
+            format_version = 1
+        assert format_version <= RECORDING_FORMAT_VERSION, f'recording format version {format_version} is newer than the supported version {RECORDING_FORMAT_VERSION}'
         
         difficulties = ["easy", "medium", "hard"]
         light_settings = [LightSetting.bright, LightSetting.standard, LightSetting.dark]
         
 
-        preprocessing_plus_infer_times, preprocessing_times = [], []
+        preprocessing_plus_infer_times, preprocessing_times, gpu_infer_times = [], [], []
         recorded_actions, reproduced_actions = [], []
 
+        self.policy.set_training_mode(False)
+        policy = self.policy
+        use_compiled_policy = episode_replay_settings.get("compile_policy", False)
+        if use_compiled_policy and not deter:
+            # inductor generates its own random numbers, the sampled actions would not match the eagerly sampled recorded ones
+            print(f'WARNING: compile_policy requires deterministic sampling, replaying with the uncompiled policy', flush=True)
+            use_compiled_policy = False
+        if use_compiled_policy:
+            policy = self.compile_policy_for_replay()
+
+        # warm up before the timed replay, the first forward passes include the cudnn algorithm selection (and the compilation)
+        n_warmup_passes = 5
+        half_precision = episode_replay_settings.get("half_precision", False) and self.device.type == "cuda"
+        self.warmup_policy(policy, deterministic=deter, n_passes=n_warmup_passes, half_precision=half_precision)
+
+        if episode_replay_settings.get("cuda_graph", False):
+            if use_compiled_policy:
+                print(f'WARNING: cuda_graph is ignored, the compiled policy already uses cuda graphs', flush=True)
+            elif self.device.type != "cuda" or not deter:
+                print(f'WARNING: cuda_graph requires a cuda device and deterministic sampling, replaying without the graph', flush=True)
+            else:
+                policy = self.capture_policy_graph(policy, half_precision=half_precision)
+
         for difficulty in difficulties:
             for light_setting in light_settings:
                 settings_path = os.path.join(base_path,f'{difficulty}_{light_setting.name}')
@@ -1528,21 +1949,27 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
                     episode_path = os.path.join(settings_path,f'episode_{idx}')
                     
                     set_random_seed(seed, using_cuda=True)
-                    times, prepro_times, recorded_actions_episode, reproduced_actions_episode = self.replay_episode(episode_path, deterministic=deter)
+                    times, prepro_times, recorded_actions_episode, reproduced_actions_episode, gpu_times = self.replay_episode(episode_path, deterministic=deter, policy=policy, format_version=format_version, half_precision=half_precision)
                     
                     preprocessing_plus_infer_times.extend(times)
                     preprocessing_times.extend(prepro_times)
+                    gpu_infer_times.extend(gpu_times)
                     recorded_actions.extend(recorded_actions_episode)
                     reproduced_actions.extend(reproduced_actions_episode)
         
         max_prepro_infer_time = np.max(preprocessing_plus_infer_times)
         max_prepro_time = np.max(preprocessing_times)
 
-        print(f'replay episode results:')
+        print(f'replay episode results (measured after {n_warmup_passes} warmup forward passes, the first step of every episode is excluded):')
         print(f'avg time for preprocessing and infer: {np.mean(preprocessing_plus_infer_times)}')
         print(f'max time for preprocessing and infer: {max_prepro_infer_time}')
         print(f'avg time for only preprocessing: {np.mean(preprocessing_times)}')
         print(f'max time for only preprocessing: {max_prepro_time}')
+        if len(gpu_infer_times) > 0:
+            # measured with cuda events, the time the gpu needs for the copy of the observation and the forward pass
+            print(f'avg gpu time for infer: {np.mean(gpu_infer_times)}')
+            print(f'max gpu time for infer: {np.max(gpu_infer_times)}')
+            np.save(os.path.join(base_path,'gpu_infer_times.npy'), gpu_infer_times)
 
         np.save(os.path.join(base_path,'preprocessing_plus_infer_times.npy'), preprocessing_plus_infer_times)
         np.save(os.path.join(base_path,'recorded_actions.npy'), recorded_actions)
@@ -1565,9 +1992,60 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
             pass
     
 
-    def replay_episode(self, episode_path, deterministic):
+    def compile_policy_for_replay(self):
+        # the replay runs the policy with the same input shape (1, C, H, W) every step
+        # reduce-overhead captures it with cuda graphs, which removes most of the kernel launch overhead of the small batch
+        if not hasattr(th, "compile") or self.device.type != "cuda":
+            print(f'WARNING: compile_policy requires torch>=2.0 and a cuda device, replaying with the uncompiled policy', flush=True)
+            return self.policy
+
+        self.policy.set_training_mode(False)
+        self.setup_compile_cache()
+        # the first calls compile and record the graphs, see warmup_policy
+        return th.compile(self.policy, mode="reduce-overhead")
+
+    def capture_policy_graph(self, policy, half_precision=False):
+        # records the deterministic forward pass of a single observation as a cuda graph
+        # the replay has a static input shape (1, C, H, W), each step only copies the observation in and replays the graph
+        # returns a function with the signature of the policy, its outputs are overwritten by the next call
+        static_obs = th.from_numpy(np.zeros((1, *self.observation_space.shape), dtype=self.observation_space.dtype)).to(self.device)
+
+        # the passes before the capture have to run on a side stream
+        side_stream = th.cuda.Stream(self.device)
+        side_stream.wait_stream(th.cuda.current_stream(self.device))
+        with th.cuda.stream(side_stream), th.inference_mode(), th.autocast("cuda", dtype=th.float16, enabled=half_precision):
+            for _ in range(3):
+                policy(static_obs, deterministic=True)
+        th.cuda.current_stream(self.device).wait_stream(side_stream)
+
+        graph = th.cuda.CUDAGraph()
+        with th.inference_mode(), th.autocast("cuda", dtype=th.float16, enabled=half_precision), th.cuda.graph(graph):
+            static_outputs = policy(static_obs, deterministic=True)
+
+        def graphed_policy(obs_tensor, deterministic=True):
+            assert deterministic, f'the cuda graph was captured for deterministic actions'
+            static_obs.copy_(obs_tensor)
+            graph.replay()
+            return static_outputs
+
+        return graphed_policy
+
+    def warmup_policy(self, policy, deterministic, n_passes, half_precision=False):
+        # forward passes on a dummy observation with the shape of the replay, the outputs are discarded
+        dummy_obs = th.from_numpy(np.zeros((1, *self.observation_space.shape), dtype=self.observation_space.dtype)).to(self.device)
+        with th.inference_mode(), th.autocast("cuda", dtype=th.float16, enabled=half_precision):
+            for _ in range(n_passes):
+                policy(dummy_obs, deterministic=deterministic)
+        if self.device.type == "cuda":
+            th.cuda.synchronize(self.device)
+
+    def replay_episode(self, episode_path, deterministic, policy=None, format_version=RECORDING_FORMAT_VERSION, half_precision=False):
         env = self.env
 
+        # policy can be a compiled version of self.policy (see compile_policy_for_replay)
+        if policy is None:
+            policy = self.policy
+
 
         # this uses the first environment exclusively
         
@@ -1584,53 +2062,100 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
 
         
         def loadImage(filename):
-            im = Image.open(filename)
-            pixels_rgb = np.array(im, dtype=np.uint8)
+            # closes the file right away, the threaded loading below opens many files
+            with Image.open(filename, formats=["PNG"]) as im:
+                pixels_rgb = np.array(im, dtype=np.uint8)
             return pixels_rgb
 
         recorded_episode_length = np.load(os.path.join(episode_path,'episode_length.npy'))
 
-        recorded_actions = np.load(os.path.join(episode_path,f'sampled_actions.npy'))
-        recorded_values = np.load(os.path.join(episode_path,f'obtained_values.npy'))
-        recorded_log_probs = np.load(os.path.join(episode_path,f'obtained_log_probs.npy'))
-        assert len(recorded_actions) == recorded_episode_length, f'length of recorded actions does not match the episode length {len(recorded_actions)} != {recorded_episode_length}'
+        if format_version >= 2:
+            with np.load(os.path.join(episode_path, 'tensors.npz')) as tensors:
+                recorded_actions = tensors['sampled_actions']
+                recorded_values = tensors['obtained_values']
+                recorded_log_probs = tensors['obtained_log_probs']
 
-        for i in range(recorded_episode_length):
+            # memmapped, the frames are read from disk when they are used
+            infer_obs_unity_images = np.load(os.path.join(episode_path, 'infer_frames.npy'), mmap_mode='r')
+            step_obs_unity_images = np.load(os.path.join(episode_path, 'step_frames.npy'), mmap_mode='r')
+        else:
+            # format version 1, one png per frame
+            recorded_actions = np.load(os.path.join(episode_path,f'sampled_actions.npy'))
+            recorded_values = np.load(os.path.join(episode_path,f'obtained_values.npy'))
+            recorded_log_probs = np.load(os.path.join(episode_path,f'obtained_log_probs.npy'))
+
+            # the png decoding releases the gil, the images are loaded in parallel
+            infer_images_path = os.path.join(episode_path, "infer_images")
+            step_images_path = os.path.join(episode_path, "step_images")
+            infer_paths = [os.path.join(infer_images_path, f'infer_image_{i}.png') for i in range(recorded_episode_length)]
+            step_paths = [os.path.join(step_images_path, f'step_image_{i}.png') for i in range(recorded_episode_length)]
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                infer_obs_unity_images = list(executor.map(loadImage, infer_paths))
+                step_obs_unity_images = list(executor.map(loadImage, step_paths))
 
-            infer_obs_unity_images.append(loadImage(os.path.join(episode_path, "infer_images", f'infer_image_{i}.png')))
-            step_obs_unity_images.append(loadImage(os.path.join(episode_path,"step_images", f'step_image_{i}.png')))
+        assert len(recorded_actions) == recorded_episode_length, f'length of recorded actions does not match the episode length {len(recorded_actions)} != {recorded_episode_length}'
 
 
-        reproduced_actions, reproduced_values, reproduced_log_probs = [], [], []
+        # preallocated for the whole episode, nothing is allocated in the timed loop
+        # the values and log probs stay on the device until the end of the episode
+        episode_length = int(recorded_episode_length)
+        reproduced_actions = np.empty((episode_length, *self.action_space.shape), dtype=np.float32)
+        reproduced_values = th.empty((episode_length, 1), dtype=th.float32, device=self.device)
+        reproduced_log_probs = th.empty((episode_length,), dtype=th.float32, device=self.device)
 
-        reproduce_times = []
-        preprocessing_times = []
+        # the first step is not timed
+        n_timed_steps = max(episode_length - 1, 0)
+        reproduce_times = np.empty(n_timed_steps, dtype=np.float64)
+        preprocessing_times = np.empty(n_timed_steps, dtype=np.float64)
+        gpu_infer_times = np.empty(n_timed_steps if self.device.type == "cuda" else 0, dtype=np.float64)
 
-        def take_image(env, image):
+        def take_image(env, image, return_obs=True):
             new_obs = env.envs[0].preprocessing(image)
 
             if env.envs[0].frame_stacking > 1:
                 new_obs = env.envs[0].memory_rolloverStep(new_obs)
 
-            for idx in range(env.num_envs):
-                env._save_obs(idx, new_obs)
+            # the images of the steps only update the memory, their observation is not needed
+            if not return_obs:
+                return None
 
-            obs = env._obs_from_buf()
+            # the observation of the first env with a batch dimension, (1, C, H, W)
+            # the vec env buffers of all envs are not used, only the first env is replayed
+            return env.transpose_image(new_obs)[np.newaxis]
 
-            rtn_obs = env.transpose_observations(obs)
+        if self.device.type == "cuda":
+            # page-locked staging buffer for the single observation, the copy to the gpu can then be done asynchronously
+            # it is synchronized by the copy of the actions to the host, so it is free again in the next step
+            obs_host = th.from_numpy(np.zeros((1, *self.observation_space.shape), dtype=self.observation_space.dtype)).pin_memory()
+            obs_device = th.empty_like(obs_host, device=self.device)
+        else:
+            obs_host, obs_device = None, None
 
-            return rtn_obs
+        # the wall clock times (perf_counter) include everything the cpu waits for, actions.cpu() synchronizes with the gpu
+        # the cuda events additionally measure the time on the gpu alone
+        if self.device.type == "cuda":
+            start_event, end_event = th.cuda.Event(enable_timing=True), th.cuda.Event(enable_timing=True)
+        else:
+            start_event, end_event = None, None
 
-        replay_time_start = time.time()
+        replay_time_start = time.perf_counter()
 
         for i in range(recorded_episode_length):
 
-            with th.no_grad():
+            with th.inference_mode():
                 obs = take_image(env, infer_obs_unity_images[i])
 
-                obs_tensor = obs_as_tensor(obs, self.device)
+                if start_event is not None:
+                    start_event.record()
+
+                # only the first env is replayed (and a single car is what the timing is about)
+                if obs_host is not None:
+                    obs_host.copy_(th.from_numpy(obs))
+                    obs_tensor = obs_device.copy_(obs_host, non_blocking=True)
+                else:
+                    obs_tensor = obs_as_tensor(obs, self.device)
                 if i > 0:
-                    preprocessing_times.append(time.time() - replay_time_start)
+                    preprocessing_times[i - 1] = time.perf_counter() - replay_time_start
 
                 '''
                 if i == 0:
@@ -1639,41 +2164,71 @@ class MyOnPolicyAlgorithm(BaseAlgorithm):
                     second_obs_tensor = obs_tensor[0]
                 '''
                 
-                actions, values, log_probs = self.policy(obs_tensor, deterministic=deterministic)
+                # the observation stays uint8 until it is on the device, the policy converts and normalizes it there
+                # with half_precision the forward pass runs in float16 (cuda only)
+                with th.autocast("cuda", dtype=th.float16, enabled=half_precision):
+                    actions, values, log_probs = policy(obs_tensor, deterministic=deterministic)
+
+                if end_event is not None:
+                    end_event.record()
+
+                # copies, with cuda graphs the outputs are overwritten by the next call
+                reproduced_values[i] = values[0]
+                reproduced_log_probs[i] = log_probs[0]
             actions = actions.cpu().numpy()
 
             if i > 0:
                 # we exclude the first frame, it can take a long time if the model was not loaded on the gpu or some other reason
                 # only the very first frame of the model takes this long
-                reproduce_times.append(time.time() - replay_time_start)
+                reproduce_times[i - 1] = time.perf_counter() - replay_time_start
+                if end_event is not None:
+                    end_event.synchronize()
+                    # elapsed_time is in milliseconds
+                    gpu_infer_times[i - 1] = start_event.elapsed_time(end_event) / 1000
             
             
-            reproduced_actions.append(actions[0])
-            reproduced_values.append(values[0])
-            reproduced_log_probs.append(log_probs[0])
+            reproduced_actions[i] = actions[0]
+
+            replay_time_start = time.perf_counter()            
+            take_image(env, step_obs_unity_images[i], return_obs=False)
+
+
+        # one device to host copy each instead of one per step
+        reproduced_values = reproduced_values.cpu().numpy()
+        reproduced_log_probs = reproduced_log_probs.cpu().numpy()
+
+        # compared for the whole episode at once instead of step by step
+        # sampled actions can only be reproduced with a larger tolerance
+        actions_atol = 1e-2 if deterministic else 1e-1
+        comparisons = [
+            ("actions", recorded_actions, reproduced_actions, actions_atol),
+            ("values", recorded_values, reproduced_values, 1e+2),
+            ("log_probs", recorded_log_probs, reproduced_log_probs, 1e-3),
+        ]
+        for name, recorded, reproduced, atol in comparisons:
+            close = np.isclose(recorded, reproduced, atol=atol).reshape(recorded_episode_length, -1).all(axis=1)
+            if not close.all():
+                step = int(np.flatnonzero(~close)[0])
+                assert False, f'{name} are not the same at step {step} {recorded[step]} != {reproduced[step]}'
 
-            replay_time_start = time.time()            
-            take_image(env, step_obs_unity_images[i])
+        
 
+        return reproduce_times, preprocessing_times,  recorded_actions, reproduced_actions, gpu_infer_times
 
-        if deterministic:
-            for i in range(recorded_episode_length):
- 
-                assert np.allclose(recorded_actions[i], reproduced_actions[i], atol=1e-2), f'actions are not the same {recorded_actions[i]} != {reproduced_actions[i]}'
-                assert np.allclose(recorded_values[i], reproduced_values[i].cpu().numpy(), atol=1e+2), f'values are not the same {recorded_values[i]} != {reproduced_values[i]}'
-                assert np.allclose(recorded_log_probs[i], reproduced_log_probs[i].cpu().numpy(), atol=1e-3), f'log_probs are not the same {recorded_log_probs[i]} != {reproduced_log_probs[i]}'
-        else:
-            
 
-            for i in range(recorded_episode_length):
-                assert np.allclose(recorded_actions[i], reproduced_actions[i], atol=1e-1), f'actions are not the same {recorded_actions[i]} != {reproduced_actions[i]}'
-                assert np.allclose(recorded_values[i], reproduced_values[i].cpu().numpy(), atol=1e+2), f'values are not the same {recorded_values[i]} != {reproduced_values[i]}'
-                assert np.allclose(recorded_log_probs[i], reproduced_log_probs[i].cpu().numpy(), atol=1e-3), f'log_probs are not the same {recorded_log_probs[i]} != {reproduced_log_probs[i]}'
+def correct_rewards(buffer_rewards, bufferpos_of_step, episode_lengths, env_ids, episode_rewards):
+    # writes the real rewards of the episodes of env_ids into buffer_rewards with a single scatter
+    # and resets their episode lengths, the next episodes of these envs start at step 0 again
+    # only operates on numpy arrays, episode_rewards is a list with one float32 array per env of env_ids
+    env_ids = np.asarray(env_ids)
+    lengths = episode_lengths[env_ids]
 
-        
+    positions = np.concatenate([bufferpos_of_step[env_id, :length] for env_id, length in zip(env_ids, lengths)])
+    columns = np.repeat(env_ids, lengths)
 
-        return reproduce_times, preprocessing_times,  recorded_actions, reproduced_actions
+    buffer_rewards[positions, columns] = np.concatenate(episode_rewards)
 
+    episode_lengths[env_ids] = 0
 
 def get_obs_single_calls(env):
     # env is a vectorized BaseCarsimEnv
@@ -1685,15 +2240,17 @@ def get_obs_single_calls(env):
 
     # I think the cleanest way to solve this is by simply increasing frame stacking n
 
+    # the attributes of the wrapped DummyVecEnv are looked up once, every lookup goes through the VecEnvWrapper
+    sub_envs, save_obs = env.envs, env._save_obs
     for idx in range(env.num_envs):
-        obs = env.envs[idx].get_observation_including_memory()
+        obs = sub_envs[idx].get_observation_including_memory()
         # get_obseration_including memory does a memory rolloer as well
-        env._save_obs(idx, obs)
+        save_obs(idx, obs)
 
     obs = env._obs_from_buf()
     return env.transpose_observations(obs)
 
-def get_obs_bundled_calls(env, return_all_obsstrings=False):
+def get_obs_bundled_calls(env, return_all_obsstrings=False, out=None):
     # env is a vectorized BaseCarsimEnv
     # it is wrapped in a vec_transpose env for the CNN
 
@@ -1702,24 +2259,42 @@ def get_obs_bundled_calls(env, return_all_obsstrings=False):
 
     # I think the cleanest way to solve this is by simply increasing frame stacking n
 
-    all_obsstrings = env.envs[0].get_obsstrings_with_single_request()
+    # the attributes of the wrapped DummyVecEnv are looked up once, every lookup goes through the VecEnvWrapper
+    sub_envs, n_envs = env.envs, env.num_envs
+
+    all_obsstrings = sub_envs[0].get_obsstrings_with_single_request()
 
     #print(f'all_obsstrings type and length: {type(all_obsstrings)} {len(all_obsstrings)}')
 
-    assert len(all_obsstrings) == env.num_envs, f"all_obsstrings has wrong length {len(all_obsstrings)} != {env.num_envs}"
+    assert len(all_obsstrings) == n_envs, f"all_obsstrings has wrong length {len(all_obsstrings)} != {n_envs}"
+
+    # decoded into one array, memory_rollover copies them into the memory of each env
+    decoded_observations = sub_envs[0].stringsToObservations(all_obsstrings)
 
     all_observations = []
-    for i in range(len(all_obsstrings)):
-        obs = env.envs[i].stringToObservation(all_obsstrings[i])
-        if env.envs[i].frame_stacking > 1:
-            obs = env.envs[i].memory_rollover(obs)
+    for i in range(n_envs):
+        obs = decoded_observations[i]
+        if sub_envs[i].frame_stacking > 1:
+            obs = sub_envs[i].memory_rollover(obs)
         all_observations.append(obs)
 
-    for idx in range(env.num_envs):
+    if out is not None:
+        # write the transposed observations directly into the preallocated array
+        # avoids the copy of _obs_from_buf and a new array every step
+        assert out.shape[0] == n_envs, f"out has wrong length {out.shape[0]} != {n_envs}"
+        transpose_image = env.transpose_image
+        for idx in range(n_envs):
+            np.copyto(out[idx], transpose_image(all_observations[idx]))
+        if return_all_obsstrings:
+            return out, all_obsstrings
+        return out
+
+    save_obs = env._save_obs
+    for idx in range(n_envs):
         # get_obseration_including memory does a memory rolloer as well
 
         
-        env._save_obs(idx, all_observations[idx])
+        save_obs(idx, all_observations[idx])
 
     
 
@@ -1733,53 +2308,102 @@ def get_obs_bundled_calls(env, return_all_obsstrings=False):
         return rtn_obs, all_obsstrings
     return rtn_obs
 
-def step_wrapper(env, clipped_actions, use_bundled_calls, return_step_return_objects=False):
+def set_video_filenames(env, indices, video_filenames):
+    # sets a different video filename for each index in one pass, env_method can only pass the same arguments to all envs
+    # the filenames are only stored in python, unity receives them with the next reset
+    sub_envs = env.envs
+    for idx, video_filename in zip(indices, video_filenames):
+        sub_envs[idx].setVideoFilename(video_filename)
+
+def reset_bundled_calls(env, indices, reset_kwargs=None):
+    # env is a vectorized BaseCarsimEnv
+    # resets the envs with the given indices using one request to unity for all of them (plus one for the observations)
+    # reset_kwargs is a list with the keyword arguments of BaseCarsimEnv.reset for each index
+
+    if len(indices) == 0:
+        return
+
+    if reset_kwargs is None:
+        reset_kwargs = [{} for _ in indices]
+    assert len(reset_kwargs) == len(indices), f"reset_kwargs has wrong length {len(reset_kwargs)} != {len(indices)}"
+
+    ids = [int(idx) for idx in indices]
+    reset_args = [env.envs[idx].prepareReset(**kwargs) for idx, kwargs in zip(ids, reset_kwargs)]
+
+    obsstrings = env.envs[0].bundledReset(ids, reset_args)
+
+    for idx, obsstring in zip(ids, obsstrings):
+        env.envs[idx].finishReset(obsstring)
+
+def step_wrapper(env, clipped_actions, use_bundled_calls, return_step_return_objects=False, active_indices=None, out=None):
+    # active_indices: only these envs are stepped with bundled calls (all if None)
+    # the other envs return a zero observation, reward 0, done False and an empty info
+    # out: optional preallocated array for the observations (bundled calls only), it is returned instead of a new array
 
     if use_bundled_calls:
         #print(f'step with single request started', flush=True)
 
-        step_nrs = [env.envs[i].step_nr for i in range(env.num_envs)]
-        left_actions = [float(clipped_actions[i][0]) for i in range(env.num_envs)]
-        right_actions = [float(clipped_actions[i][1]) for i in range(env.num_envs)]
+        # one row (left, right) per env, the actions have the shape (n_envs, 2, 1)
+        actions_per_env = np.asarray(clipped_actions).reshape(env.num_envs, -1)
 
-        stepReturnObjects = env.envs[0].bundledStep(step_nrs = step_nrs, left_actions=left_actions, right_actions=right_actions)
+        if active_indices is None:
+            active_indices = range(env.num_envs)
+            ids = None
+        else:
+            # python ints, they are sent to unity
+            active_indices = np.asarray(active_indices).tolist()
+            ids = active_indices
+            actions_per_env = actions_per_env[active_indices]
+
+        # the attribute lookup through the VecEnv is done once
+        sub_envs = env.envs
+        step_nrs = [sub_envs[i].step_nr for i in active_indices]
+        # tolist converts the whole column to python floats at once
+        left_actions = actions_per_env[:, 0].tolist()
+        right_actions = actions_per_env[:, 1].tolist()
+
+        stepReturnObjects = sub_envs[0].bundledStep(step_nrs = step_nrs, left_actions=left_actions, right_actions=right_actions, ids=ids)
         # first do the bundled request to unity
 
         
-        rewards = []
-        dones = []
-        truncateds = []
-        infos = []
-
-        rtn_new_obs_n = np.zeros((env.num_envs, *env.observation_space.shape))
+        # new arrays every step, dones is kept as _last_episode_starts until after the next step
+        rewards = np.zeros(env.num_envs, dtype=np.float32)
+        dones = np.zeros(env.num_envs, dtype=bool)
+        infos = [{} for _ in range(env.num_envs)]
+
+        # in the dtype of the observation space (uint8 images) instead of float64, 8 times less memory to write
+        if out is not None and out.shape == (env.num_envs, *env.observation_space.shape):
+            # the caller makes sure the previous observations in out are not needed anymore
+            rtn_new_obs_n = out
+            if ids is not None:
+                # only the rows of the inactive envs, the others are written below
+                inactive = np.ones(env.num_envs, dtype=bool)
+                inactive[ids] = False
+                rtn_new_obs_n[inactive] = 0
+        elif ids is None:
+            # every row is written below
+            rtn_new_obs_n = np.empty((env.num_envs, *env.observation_space.shape), dtype=env.observation_space.dtype)
+        else:
+            rtn_new_obs_n = np.zeros((env.num_envs, *env.observation_space.shape), dtype=env.observation_space.dtype)
         #print(f'shape new rtn obs: {rtn_new_obs_n.shape} {type(rtn_new_obs_n)}', flush=True)
-        for idx in range(env.num_envs):
+        transpose_image = env.transpose_image
+        for stepReturnObject, idx in zip(stepReturnObjects, active_indices):
             # give the results to the corresponding envs
             # print(f'stepReturnObjects[idx]: {stepReturnObjects[idx]}', flush=True)
 
-            new_ob, reward, done, truncated, info = env.envs[idx].processStepReturnObject(stepReturnObjects[idx])
+            new_ob, reward, done, truncated, info = sub_envs[idx].processStepReturnObject(stepReturnObject)
             
-            new_ob_transposed = env.transpose_observations(new_ob)
-            rtn_new_obs_n[idx] = new_ob_transposed
-
-            #new_obs.append(new_ob)
-            rewards.append(reward)
-            dones.append(done)
-            truncateds.append(truncated)
-            infos.append(info)
-
-        #rtn_new_obs = np.array(new_obs)
-        #print(f'shape new obs: {rtn_new_obs.shape} {type(rtn_new_obs)}', flush=True)
-
-        #transpose_obs = env.transpose_observations(rtn_new_obs)
-        #print(f'shape transposed obs: {transpose_obs.shape} {type(transpose_obs)}', flush=True)
+            # transpose_image returns a view, the only copy is the assignment
+            np.copyto(rtn_new_obs_n[idx], transpose_image(new_ob))
 
-        #assert np.array_equal(transpose_obs, rtn_new_obs_n), f'new obs not equal {transpose_obs} {rtn_new_obs_n}'
+            rewards[idx] = reward
+            dones[idx] = done
+            infos[idx] = info
 
         if return_step_return_objects:
-            return rtn_new_obs_n, np.array(rewards), np.array(dones), infos, stepReturnObjects
+            return rtn_new_obs_n, rewards, dones, infos, stepReturnObjects
         else:
-            return rtn_new_obs_n, np.array(rewards), np.array(dones), infos
+            return rtn_new_obs_n, rewards, dones, infos
     else:
         # old approach
         return env.step(clipped_actions)
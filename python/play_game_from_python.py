@@ -133,10 +133,10 @@ def run(cfg) -> None:
                 new_obs, reward, terminated, truncated, info_dict  = env.step((float(
                     left_acceleration), float(right_acceleration)))
                 
-                distance_reward = float(info_dict["distanceReward"].replace(",","."))
-                velocity_reward = float(info_dict["velocityReward"].replace(",","."))
-                event_reward = float(info_dict["eventReward"].replace(",","."))
-                orientation_reward = float(info_dict["orientationReward"].replace(",","."))
+                distance_reward = float(info_dict["distanceReward"])
+                velocity_reward = float(info_dict["velocityReward"])
+                event_reward = float(info_dict["eventReward"])
+                orientation_reward = float(info_dict["orientationReward"])
 
                 print(f'distance_reward {distance_reward} velocity_reward {velocity_reward} event_reward {event_reward} orientation_reward {orientation_reward}', flush=True)
 
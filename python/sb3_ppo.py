@@ -7,6 +7,7 @@
 import gymnasium as gym
 
 from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import DummyVecEnv
 
 from stable_baselines3.common.utils import set_random_seed
 
@@ -28,6 +29,7 @@ from hydra.core.hydra_config import HydraConfig
 from omegaconf import OmegaConf
 
 
+import hashlib
 import logging
 import os
 
@@ -44,7 +46,11 @@ def run_ppo(cfg):
 
     set_random_seed(seed)
     # https://stable-baselines3.readthedocs.io/en/master/guide/algos.html#reproducibility
-    logger.add_text("Torch Seed", f"{torch.get_rng_state()}")
+    # a digest instead of the full ~5kB rng state, equal digests still verify that the runs were seeded the same
+    logger.add_text("Torch Seed", hashlib.blake2b(torch.get_rng_state().numpy().tobytes(), digest_size=8).hexdigest())
+    # only used for these two texts, the model logs to its own writer (tensorboard_log)
+    # closing flushes them and stops the flush thread of this writer for the rest of the run
+    logger.close()
 
     # we use own replay buffer that saves the observation space as uint8 instead of float32
     # int8 is 8bit, float32 is 32bit --> this saves a lot of space
@@ -63,7 +69,10 @@ def run_ppo(cfg):
 
 
     # Parallel environments
-    vec_env = make_vec_env(carsimGymEnv.BaseCarsimEnv, n_envs=n_envs, env_kwargs=env_kwargs)
+    # DummyVecEnv on purpose, all envs are arenas in the same unity instance and share one connection (BaseCarsimEnv.unity_comms)
+    # the arena ids are taken from BaseCarsimEnv.instancenumber, which would start at 0 again in every SubprocVecEnv worker
+    # the parallel stepping of all arenas is done in unity with the bundled calls (use_bundled_calls) instead
+    vec_env = make_vec_env(carsimGymEnv.BaseCarsimEnv, n_envs=n_envs, env_kwargs=env_kwargs, vec_env_cls=DummyVecEnv)
     # the n_envs can quickly be too much since the replay buffer will grow
     # the observations are quite big (float32)
 
@@ -89,7 +98,7 @@ def run_ppo(cfg):
     policy_kwargs = {"net_arch": OmegaConf.to_container(cfg.algo_settings.net_arch)}
 
     model = algo(cfg.algo_settings.policy, vec_env, verbose=1,
-                tensorboard_log="./tmp", n_epochs=cfg.algo_settings.n_epochs, batch_size=cfg.algo_settings.batch_size, n_steps=cfg.algo_settings.n_steps, policy_kwargs=policy_kwargs, seed = seed, use_bundled_calls=cfg.algo_settings.use_bundled_calls, use_fresh_obs=cfg.algo_settings.use_fresh_obs, print_network_and_loss_structure=cfg.algo_settings.print_network_and_loss_structure)
+                tensorboard_log="./tmp", n_epochs=cfg.algo_settings.n_epochs, batch_size=cfg.algo_settings.batch_size, n_steps=cfg.algo_settings.n_steps, policy_kwargs=policy_kwargs, seed = seed, use_bundled_calls=cfg.algo_settings.use_bundled_calls, use_fresh_obs=cfg.algo_settings.use_fresh_obs, print_network_and_loss_structure=cfg.algo_settings.print_network_and_loss_structure, use_compile=cfg.algo_settings.get("use_compile", False), use_amp=cfg.algo_settings.get("use_amp", False))
     # CnnPolicy network architecture can be seen in sb3.common.torch_layers.py
 
     print(f"model weights for seed verification: {model.policy.value_net.weight[0][0:5]}")
@@ -149,9 +158,12 @@ def main(cfg):
     with open('config.yaml', 'w') as f:
         OmegaConf.save(cfg, f)
 
-    import cProfile
-    cProfile.runctx('run_ppo(cfg.cfg)', globals(), locals(), sort='cumtime')
-    #run_ppo(cfg.cfg)
+    # the profiler hooks every python call and slows down the rollouts, only use it for profiling runs
+    if cfg.cfg.get("profile", False):
+        import cProfile
+        cProfile.runctx('run_ppo(cfg.cfg)', globals(), locals(), sort='cumtime')
+    else:
+        run_ppo(cfg.cfg)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
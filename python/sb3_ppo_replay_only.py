@@ -31,6 +31,7 @@ from hydra.core.hydra_config import HydraConfig
 from omegaconf import OmegaConf
 
 
+import hashlib
 import logging
 import os
 import random
@@ -48,7 +49,11 @@ def run_replay(cfg):
 
     set_random_seed(seed)
     # https://stable-baselines3.readthedocs.io/en/master/guide/algos.html#reproducibility
-    logger.add_text("Torch Seed", f"{torch.get_rng_state()}")
+    # a digest instead of the full ~5kB rng state, equal digests still verify that the runs were seeded the same
+    logger.add_text("Torch Seed", hashlib.blake2b(torch.get_rng_state().numpy().tobytes(), digest_size=8).hexdigest())
+    # only used for these two texts, the model logs to its own writer (tensorboard_log)
+    # closing flushes them and stops the flush thread of this writer for the rest of the run
+    logger.close()
 
     print(f'a random torch int {torch.randint(0, 100, (1,))}')
     print(f'a random torch int2 {torch.randint(0, 100, (1,))}')
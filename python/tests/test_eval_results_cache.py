@@ -0,0 +1,68 @@
+import pytest
+
+from gymEnv.myEnums import LightSetting
+from myPPO.my_on_policy_algorithm import MyOnPolicyAlgorithm
+
+
+class EvaluationRan(Exception):
+    pass
+
+
+def make_model():
+    # only the attributes used by the cache, no env or policy is needed
+    model = MyOnPolicyAlgorithm.__new__(MyOnPolicyAlgorithm)
+    model.num_timesteps = 1000
+    model._eval_results_cache = {}
+
+    def generate_map_and_rotations(difficulty, n_eval_episodes, env):
+        raise EvaluationRan()
+
+    model.generate_map_and_rotations = generate_map_and_rotations
+    return model
+
+
+def evaluate(model, **kwargs):
+    settings = dict(n_eval_episodes=2, difficulties=["easy"], iteration=0, light_setting=LightSetting.standard, use_fresh_obs=False, deterministic=True, log=False, record_videos=False)
+    settings.update(kwargs)
+    return model.basic_evaluation_algorithm_multi(**settings)
+
+
+def fill_cache(model):
+    key = model.eval_results_cache_key("easy", 2, 0, LightSetting.standard, False, True, False, "DifferentialJetBot", False)
+    model._eval_results_cache[key] = (0.5, 0.25)
+
+
+def test_deterministic_run_uses_cache():
+    model = make_model()
+    fill_cache(model)
+
+    assert evaluate(model) == {"easy": (0.5, 0.25)}
+
+
+def test_cache_depends_on_timestep():
+    model = make_model()
+    fill_cache(model)
+    model.num_timesteps = 2000
+
+    with pytest.raises(EvaluationRan):
+        evaluate(model)
+
+
+@pytest.mark.parametrize("settings", [{"record_videos": True}, {"log": True}])
+def test_runs_with_artifacts_bypass_cache(settings):
+    model = make_model()
+    fill_cache(model)
+
+    # the evaluation runs although identical results are cached, the videos and logs are produced
+    with pytest.raises(EvaluationRan):
+        evaluate(model, **settings)
+    assert model.eval_results_cache_key("easy", 2, 0, LightSetting.standard, False, True, settings.get("log", False), "DifferentialJetBot", settings.get("record_videos", False)) is None
+
+
+def test_nondeterministic_run_bypasses_cache():
+    model = make_model()
+    fill_cache(model)
+
+    with pytest.raises(EvaluationRan):
+        evaluate(model, deterministic=False)
+    assert model.eval_results_cache_key("easy", 2, 0, LightSetting.standard, False, False, False, "DifferentialJetBot", False) is None